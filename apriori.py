@@ -1,4 +1,4 @@
-from itertools import product
+from collections import defaultdict
 import sys
 
 if sys.version_info[0] < 3:
@@ -20,11 +20,23 @@ def apriori(index, minsup):
     itemset_size = 1
     while len(candidates) > 0:
         generation = set()
-        for (a, b) in product(candidates, repeat=2):
-            if (len(a - b) == 1
-                and index.support(a | b) >= minsup
-                    and contains_all_subsets(a | b, candidates)):
-                generation.add(frozenset(a | b))
+        # Join pairs of candidates which differ only in their last item in
+        # sorted order. A candidate of the next generation has all its
+        # subsets in this one, so it's the join of exactly one such pair.
+        suffixes = defaultdict(list)
+        for candidate in candidates:
+            items = sorted(candidate)
+            suffixes[tuple(items[:-1])].append(items[-1])
+        for (prefix, last_items) in suffixes.items():
+            last_items.sort()
+            for (i, a) in enumerate(last_items):
+                for b in last_items[i + 1:]:
+                    candidate = frozenset(prefix + (a, b))
+                    # Checking the candidate's subsets is cheaper than
+                    # counting its support in the index.
+                    if (contains_all_subsets(candidate, candidates)
+                            and index.support(candidate) >= minsup):
+                        generation.add(candidate)
         print(
             "Generated {} itemsets of size {}".format(
                 len(generation),
@@ -0,0 +1,150 @@
+from array import array
+from collections import Counter
+import sys
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+ROOT = 0
+NO_NODE = -1
+
+
+class ItemCodes:
+    # Maps the items stored in a tree to the small integer codes stored in
+    # its item column. Shared between a tree and all the conditional trees
+    # built from it, so the codes are consistent while mining.
+    def __init__(self):
+        self.code_of = {}
+        self.item_of = []
+
+    def code(self, item):
+        code = self.code_of.get(item)
+        if code is None:
+            code = len(self.item_of)
+            self.code_of[item] = code
+            self.item_of.append(item)
+        return code
+
+
+class ArrayFPTree:
+    # An FP-tree with the same interface as fptree.FPTree, but whose nodes
+    # live in parallel array columns rather than in FPNode objects. Node 0 is
+    # the root. Children of a node form a linked list through first_child
+    # and next_sibling, and the nodes for each item are linked together from
+    # header[code] through node_link. This uses a handful of machine words
+    # per node, and walking paths up to the root while building conditional
+    # trees touches contiguous memory rather than chasing object pointers.
+    def __init__(self, codes=None):
+        self.codes = codes if codes is not None else ItemCodes()
+        self.item = array('i', [NO_NODE])
+        self.count = array('i', [0])
+        self.parent = array('i', [NO_NODE])
+        self.first_child = array('i', [NO_NODE])
+        self.next_sibling = array('i', [NO_NODE])
+        self.node_link = array('i', [NO_NODE])
+        self.header = {}
+        self.item_count = Counter()
+        self.num_transactions = 0
+        # Position of each item in the order the tree's paths are sorted in,
+        # if known. Shared with conditional trees.
+        self.item_rank = None
+
+    def __len__(self):
+        # Number of nodes in the tree, excluding the root.
+        return len(self.item) - 1
+
+    def insert(self, transaction, count=1):
+        self.insert_codes(map(self.codes.code, transaction), count)
+
+    def insert_codes(self, codes, count=1):
+        assert(count > 0)
+        item_of = self.codes.item_of
+        node = ROOT
+        self.num_transactions += count
+        for code in codes:
+            self.item_count[item_of[code]] += count
+            child = self.first_child[node]
+            while child != NO_NODE and self.item[child] != code:
+                child = self.next_sibling[child]
+            if child == NO_NODE:
+                child = len(self.item)
+                self.item.append(code)
+                self.count.append(count)
+                self.parent.append(node)
+                self.first_child.append(NO_NODE)
+                self.next_sibling.append(self.first_child[node])
+                self.first_child[node] = child
+                self.node_link.append(self.header.get(code, NO_NODE))
+                self.header[code] = child
+            else:
+                self.count[child] += count
+            node = child
+
+    def nodes_of(self, item):
+        node = self.header.get(self.codes.code_of.get(item), NO_NODE)
+        while node != NO_NODE:
+            yield node
+            node = self.node_link[node]
+
+    def path_to_root(self, node):
+        # Returns the item codes on the path from node up to, but excluding,
+        # the root.
+        path = []
+        while node != ROOT:
+            path.append(self.item[node])
+            node = self.parent[node]
+        return path
+
+    def prefix_paths(self, item, keep=None):
+        # Iterates over the conditional pattern base of item; the (path, count)
+        # of the path from the root down to each node for item, excluding
+        # the node itself. If keep is passed, only items in it are kept.
+        item_of = self.codes.item_of
+        for node in self.nodes_of(item):
+            path = [item_of[code]
+                    for code in self.path_to_root(self.parent[node])]
+            if keep is not None:
+                path = [i for i in path if i in keep]
+            path.reverse()
+            yield (path, self.count[node])
+
+    def conditional_item_counts(self, item):
+        # Returns the item counts which the conditional tree for item would
+        # have, without building it.
+        counts = Counter()
+        item_of = self.codes.item_of
+        for node in self.nodes_of(item):
+            count = self.count[node]
+            parent = self.parent[node]
+            while parent != ROOT:
+                counts[item_of[self.item[parent]]] += count
+                parent = self.parent[parent]
+        return counts
+
+    def single_path(self):
+        # If the tree is a single chain of nodes, returns the list of
+        # (item, count) on it in root-to-leaf order, else None.
+        path = []
+        item_of = self.codes.item_of
+        node = self.first_child[ROOT]
+        while node != NO_NODE:
+            if self.next_sibling[node] != NO_NODE:
+                return None
+            path.append((item_of[self.item[node]], self.count[node]))
+            node = self.first_child[node]
+        return path
+
+    def conditional_tree(self, item, keep=None):
+        # If keep is passed, only the items in it are kept in the
+        # conditional tree; the others are known to be infrequent in it.
+        conditional_tree = ArrayFPTree(self.codes)
+        conditional_tree.item_rank = self.item_rank
+        if keep is not None:
+            keep = set(map(self.codes.code, keep))
+        for node in self.nodes_of(item):
+            path = self.path_to_root(self.parent[node])
+            if keep is not None:
+                path = [code for code in path if code in keep]
+            path.reverse()
+            conditional_tree.insert_codes(path, self.count[node])
+        return conditional_tree
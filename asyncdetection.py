@@ -0,0 +1,202 @@
+# Drift detection over live transaction feeds with asyncio; for example
+# transactions arriving over a socket or a pipe as lines of comma separated
+# item names, or put on an asyncio.Queue by a message bus consumer:
+#
+#   queue = asyncio.Queue(maxsize=10000)
+#   ...
+#   async for (transaction_num, drift) in detect(queue_transactions(queue),
+#                                                args):
+#       ...
+#
+# args are as parsed by virtualchangedetection.make_arg_parser(); args.input
+# isn't used.
+
+import asyncio
+import csv
+from collections import Counter
+from collections import deque
+from driftdetector import SAMPLE_INTERVAL
+from incrementalfptree import IncrementalFPGrowth
+from item import Vocabulary
+from virtualchangedetection import log_drift
+from virtualchangedetection import make_drift_detector
+from virtualchangedetection import make_volatility_detector
+from virtualchangedetection import mine_window
+from virtualchangedetection import quiet
+from virtualchangedetection import save_rules
+
+# Default number of transactions read ahead of the one being checked. When
+# this many are waiting, we stop reading from the stream until we catch up.
+MAX_BUFFERED_TRANSACTIONS = 10000
+
+# Put on the read ahead queue when the stream ends.
+END_OF_STREAM = None
+
+
+def parse_transaction(line):
+    # Parses a line of comma separated item names, as in the CSV files
+    # DatasetReader reads.
+    return next(csv.reader([line]), [])
+
+
+async def stream_transactions(reader):
+    # Yields the transactions read from an asyncio.StreamReader, one per
+    # line; e.g. from asyncio.open_connection(), or from a pipe via
+    # open_pipe_reader(). Blank lines are skipped.
+    while True:
+        line = await reader.readline()
+        if len(line) == 0:
+            break
+        line = line.decode().rstrip("\r\n")
+        if len(line) > 0:
+            yield parse_transaction(line)
+
+
+async def open_pipe_reader(pipe):
+    # Returns an asyncio.StreamReader reading from pipe, a file object such
+    # as sys.stdin.
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+
+async def queue_transactions(queue):
+    # Yields the transactions put on an asyncio.Queue, until None is put. A
+    # queue with a maxsize makes its producers wait while it's full.
+    while True:
+        transaction = await queue.get()
+        if transaction is None:
+            break
+        yield transaction
+
+
+async def read_ahead(transactions, buffer):
+    # Reads transactions into buffer, a bounded queue, so that reading
+    # waits whenever the buffer is full.
+    try:
+        async for transaction in transactions:
+            await buffer.put(transaction)
+    except Exception as exception:
+        await buffer.put(exception)
+    await buffer.put(END_OF_STREAM)
+
+
+async def next_transaction(buffer):
+    transaction = await buffer.get()
+    if isinstance(transaction, Exception):
+        raise transaction
+    return transaction
+
+
+async def detect(transactions,
+                 args,
+                 executor=None,
+                 log=print,
+                 metrics=None,
+                 max_buffered=MAX_BUFFERED_TRANSACTIONS):
+    # The asynchronous counterpart of virtualchangedetection.detect_drifts().
+    # transactions is an async iterable of transactions, each a list of item
+    # names. Yields (transaction_num, drift) for each drift detected.
+    #
+    # Up to max_buffered transactions are read ahead of the one being
+    # checked, so the stream keeps being read while a training window is
+    # mined in executor (the event loop's default executor if None), and
+    # reading stops, holding up the stream's producer, while they wait. An
+    # executor running mining in other processes can't be used with
+    # incremental mining, as the miner is kept between windows. As in
+    # detect_drifts(), the window mined after a drift in incremental mining
+    # mode is the one ending at the drift, so the last window's worth of
+    # transactions are kept.
+    if metrics is None:
+        metrics = Counter()
+    loop = asyncio.get_running_loop()
+    buffer = asyncio.Queue(maxsize=max_buffered)
+    reader = asyncio.ensure_future(read_ahead(transactions, buffer))
+
+    vocabulary = Vocabulary()
+    transaction_num = 0
+    end_of_last_window = 0
+    cohort_num = 1
+    volatility_detector = make_volatility_detector(args)
+    miner = None
+    recent = None
+    if args.incremental_mining:
+        miner = IncrementalFPGrowth(
+            args.training_window_size, args.min_support)
+        recent = deque(maxlen=args.training_window_size)
+    ended = False
+    drift = None
+    try:
+        while not ended:
+            if drift is not None and miner is not None:
+                window = list(recent)
+            else:
+                window = []
+                while len(window) < args.training_window_size:
+                    transaction = await next_transaction(buffer)
+                    if transaction is END_OF_STREAM:
+                        ended = True
+                        break
+                    window.append(vocabulary.encode(transaction))
+                transaction_num += len(window)
+                if recent is not None:
+                    recent.extend(window)
+            drift = None
+            if len(window) == 0:
+                break
+            metrics["windows"] += 1
+            window_start = transaction_num - len(window)
+            log("")
+            log(
+                "Mining window [{},{}]".format(
+                    window_start,
+                    transaction_num))
+            overlap = max(0, end_of_last_window - window_start)
+            end_of_last_window = transaction_num
+            (rules, mining_metrics) = await loop.run_in_executor(
+                executor, mine_window, args, window, miner, overlap)
+            metrics.update(mining_metrics)
+            log("Generated {} rules".format(len(rules)), flush=True)
+
+            if len(rules) == 0:
+                log("No rules; just noise. Skipping change detection.")
+                continue
+
+            if args.save_rules:
+                await loop.run_in_executor(
+                    executor, save_rules, args, rules, cohort_num, vocabulary,
+                    quiet)
+                cohort_num += 1
+
+            drift_detector = make_drift_detector(args, volatility_detector)
+            drift_detector.train(window, rules)
+
+            # Read transactions until a drift is detected.
+            while not ended:
+                transaction = await next_transaction(buffer)
+                if transaction is END_OF_STREAM:
+                    ended = True
+                    break
+                transaction_num += 1
+                transaction = vocabulary.encode(transaction)
+                if recent is not None:
+                    recent.append(transaction)
+                drift = drift_detector.check_for_drift(
+                    transaction, transaction_num)
+                if transaction_num % SAMPLE_INTERVAL == 0:
+                    # Getting from a queue which isn't empty doesn't yield to
+                    # the event loop; let the reader and other tasks run.
+                    await asyncio.sleep(0)
+                if drift is not None:
+                    metrics["drifts"] += 1
+                    log_drift(drift, transaction_num, end_of_last_window, log)
+                    if volatility_detector is not None:
+                        volatility_detector.add(transaction_num)
+                    yield (transaction_num, drift)
+                    break
+    finally:
+        reader.cancel()
+
+    metrics["transactions"] = transaction_num
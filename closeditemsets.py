@@ -0,0 +1,57 @@
+import sys
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+
+class ClosedItemsetCounts(dict):
+    # Maps closed itemsets to their counts. Looking up a frequent itemset
+    # which isn't closed gives the count of its closure; the largest count of
+    # any closed itemset which contains it. So this can stand in for the
+    # counts of all frequent itemsets, as needed by generate_rules(), while
+    # only storing the closed ones.
+    def __init__(self):
+        super().__init__()
+        # Map of item to the closed itemsets which contain it.
+        self.containing = dict()
+        # Counts of non-closed itemsets which have already been looked up.
+        self.derived = dict()
+
+    def add(self, itemset, count):
+        self[itemset] = count
+        for item in itemset:
+            if item not in self.containing:
+                self.containing[item] = []
+            self.containing[item].append(itemset)
+
+    def __missing__(self, itemset):
+        if itemset in self.derived:
+            return self.derived[itemset]
+        if len(itemset) == 0 or any(
+                item not in self.containing for item in itemset):
+            raise KeyError(itemset)
+        candidates = min((self.containing[item] for item in itemset), key=len)
+        counts = [dict.__getitem__(self, closed) for closed in candidates
+                  if itemset <= closed]
+        if len(counts) == 0:
+            raise KeyError(itemset)
+        count = max(counts)
+        self.derived[itemset] = count
+        return count
+
+
+class ClosedItemsetFilter:
+    # Records closed itemsets as they're found. Expects every closed
+    # superset of an itemset with the same count to have been recorded
+    # before the itemset is checked.
+    def __init__(self):
+        self.closed_by_count = dict()
+
+    def record_if_closed(self, itemset, count):
+        if count not in self.closed_by_count:
+            self.closed_by_count[count] = []
+        closed = self.closed_by_count[count]
+        if any(itemset <= other for other in closed):
+            return False
+        closed.append(itemset)
+        return True
@@ -1,11 +1,25 @@
 import csv
 from item import Item
+from transactionstore import load_transactions
 
 
 class DatasetReader:
-    def __init__(self, csv_file_path):
+    # Iterates over the transactions in a CSV file. If a Vocabulary is
+    # passed, transactions are array('i') of interned item ids, otherwise
+    # they're lists of Items. Transactions of item ids are parsed in bulk,
+    # and if cache is True, cached next to the CSV file for the next run.
+    def __init__(self, csv_file_path, vocabulary=None, cache=False):
         self.csv_file_path = csv_file_path
+        self.vocabulary = vocabulary
+        self.cache = cache
 
     def __iter__(self):
-        return map(lambda txn: list(set(map(Item, txn))),
-                   csv.reader(open(self.csv_file_path, newline='')))
+        if self.vocabulary is not None:
+            return iter(load_transactions(
+                self.csv_file_path, self.vocabulary, self.cache))
+        return self.read_items()
+
+    def read_items(self):
+        with open(self.csv_file_path, newline='') as csv_file:
+            for txn in csv.reader(csv_file):
+                yield list(set(map(Item, txn)))
@@ -1,5 +1,5 @@
+import logging
 import numpy
-from copy import deepcopy
 from hoeffdingbound import hoeffding_bound
 from rollingmean import RollingMean
 from ruletree import RuleTree
@@ -22,11 +22,48 @@ SAMPLE_THRESHOLD = 30
 
 _SQRT2 = numpy.sqrt(2)
 
+# The drift confidence used at each sample is logged at debug level.
+logger = logging.getLogger(__name__)
+
 
 def hellinger(p, q):
     return norm(numpy.sqrt(p) - numpy.sqrt(q)) / _SQRT2
 
 
+class HellingerDistance:
+    # The Hellinger distance between a fixed vector of rule supports p, and
+    # the supports of the rules in rule_tree, indexed by rule id. The sum of
+    # squared differences of the supports' square roots is kept, along with
+    # its terms, so that after the first distance only the terms of the
+    # rules whose counts changed need updating, unless the number of
+    # transactions the supports are over changes.
+    def __init__(self, p, rule_tree):
+        self.sqrt_p = numpy.sqrt(p)
+        self.rule_tree = rule_tree
+        self.terms = numpy.zeros(len(p))
+        self.sum = 0.0
+        self.transaction_count = None
+
+    def distance(self):
+        tree = self.rule_tree
+        changed = tree.take_changed_rules()
+        if tree.transaction_count != self.transaction_count:
+            self.transaction_count = tree.transaction_count
+            numpy.subtract(self.sqrt_p,
+                           numpy.sqrt(tree.support_vector()),
+                           out=self.terms)
+            numpy.square(self.terms, out=self.terms)
+            self.sum = self.terms.sum()
+        elif len(changed) > 0:
+            terms = numpy.square(
+                self.sqrt_p[changed] -
+                numpy.sqrt(tree.match_counts[changed] /
+                           self.transaction_count))
+            self.sum += terms.sum() - self.terms[changed].sum()
+            self.terms[changed] = terms
+        return numpy.sqrt(max(self.sum, 0.0)) / _SQRT2
+
+
 class Drift:
     def __init__(
             self,
@@ -53,28 +90,43 @@ class DriftDetector:
 
         # Populate the training rule tree with the rule frequencies from
         # the training window.
-        for transaction in window:
-            self.training_rule_tree.record_matches(transaction)
+        self.training_rule_tree.record_matches_batch(window)
 
-        # Populate the test rule tree with a deep copy of the training set.
-        self.test_rule_tree = deepcopy(self.training_rule_tree)
+        # Populate the test rule tree with a copy of the training set's
+        # counts, sharing its rules.
+        self.test_rule_tree = self.training_rule_tree.copy()
 
         # Record the match vector; the vector of rules' supports in the
-        # training window.
-        self.training_match_vec = self.training_rule_tree.match_vector()
-
-        self.num_test_transactions = 0
+        # training window, which the test window's supports are compared
+        # against.
+        self.training_match_vec = numpy.copy(
+            self.training_rule_tree.support_vector())
+        self.test_distance = HellingerDistance(self.training_match_vec,
+                                               self.test_rule_tree)
+
+        # Transactions read since the last sample, which are matched against
+        # the rules as a block when the next sample is taken.
+        self.test_transactions = []
         self.rule_vec_mean = RollingMean()
         self.rag_bag_mean = RollingMean()
 
     def check_for_drift(self, transaction, transaction_num):
-        self.test_rule_tree.record_matches(transaction)
-        self.num_test_transactions += 1
-        if self.num_test_transactions < SAMPLE_INTERVAL:
+        self.test_transactions.append(transaction)
+        if len(self.test_transactions) < SAMPLE_INTERVAL:
             return None
-
-        # Sample and test for drift.
-        self.num_test_transactions = 0
+        block = self.test_transactions
+        self.test_transactions = []
+        return self.check_block(block, transaction_num)
+
+    def check_block(self, block, transaction_num):
+        # Samples and tests for drift after the SAMPLE_INTERVAL transactions
+        # in block, the last of which is transaction_num, when no
+        # transactions have been read since the last sample. block may be a
+        # view of a TransactionStore, which is matched without copying out
+        # its transactions.
+        assert(len(block) == SAMPLE_INTERVAL)
+        assert(len(self.test_transactions) == 0)
+        self.test_rule_tree.record_matches_batch(block)
 
         if (self.rule_vec_mean.n + 1 > SAMPLE_THRESHOLD or
                 self.rag_bag_mean.n + 1 > SAMPLE_THRESHOLD):
@@ -82,16 +134,13 @@ class DriftDetector:
             # Note: the +1 is there because of the add_sample() call below.
             gamma = self.volatility_detector.drift_confidence(
                 transaction_num)
-            print(
-                "gamma at transaction {} is {}".format(
-                    transaction_num, gamma))
+            logger.debug(
+                "gamma at transaction %s is %s", transaction_num, gamma)
             drift_confidence = 2.5 - gamma
 
         # Detect whether the rules' supports in the test window differ
         # from the rules' supports in the training window.
-        distance = hellinger(
-            self.training_match_vec,
-            self.test_rule_tree.match_vector())
+        distance = self.test_distance.distance()
         self.rule_vec_mean.add_sample(distance)
         if self.rule_vec_mean.n > SAMPLE_THRESHOLD:
             conf = self.rule_vec_mean.std_dev() * drift_confidence
@@ -0,0 +1,92 @@
+# Vertical frequent itemset mining; Eclat, and its variant dEclat, over the
+# transaction bitmaps of an InvertedIndex. Rather than compressing the
+# transactions into a tree, Eclat keeps the set of transactions containing
+# each itemset, and counts an itemset's extensions by intersecting the sets.
+# dEclat instead keeps each itemset's diffset; the transactions containing
+# its prefix but not the itemset, which shrink as itemsets grow, and so are
+# faster to combine on dense data.
+
+from index import InvertedIndex
+from index import popcount
+import numpy
+import sys
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+EclatMiningAlgorithm = "eclat"
+DEclatMiningAlgorithm = "declat"
+
+
+def eclat_search(index, min_count, diffsets=False, max_length=None):
+    # Depth first search for the frequent itemsets in index. Uses an
+    # explicit stack of equivalence classes; a prefix, and the items which
+    # extend it into frequent itemsets, in increasing order of count, with
+    # the itemsets' counts and, one per row of a 2-D array, their bitmaps.
+    # Those are transaction bitmaps, or if diffsets is True, below the top
+    # class, diffsets relative to the prefix. A class's child classes are
+    # formed by joining each of its itemsets with the ones after it, all at
+    # once. Yields (itemset, count, is_leaf), with is_leaf as
+    # fptree.fp_growth_search() yields it; true if searching further from
+    # the itemset found nothing more.
+    frequent = []
+    for item in index.items():
+        count = int(popcount(index.bitmap(item)))
+        if count >= min_count:
+            frequent.append((count, item))
+    frequent.sort()
+    if len(frequent) == 0:
+        return
+    items = [item for (_, item) in frequent]
+    bitmaps = numpy.stack([index.bitmap(item) for item in items])
+    counts = numpy.array([count for (count, _) in frequent])
+    stack = [((), items, bitmaps, counts, False)]
+    while len(stack) > 0:
+        (prefix, items, bitmaps, counts, is_diffset) = stack.pop()
+        for i in range(len(items)):
+            itemset = prefix + (items[i],)
+            extended = None
+            if max_length is None or len(itemset) < max_length:
+                later = bitmaps[i + 1:]
+                if not diffsets:
+                    extended = later & bitmaps[i]
+                    extended_counts = popcount(extended, axis=1)
+                else:
+                    if is_diffset:
+                        # d(PXY) = d(PY) - d(PX)
+                        extended = later & ~bitmaps[i]
+                    else:
+                        # d(PXY) = t(PX) - t(PY)
+                        extended = bitmaps[i] & ~later
+                    extended_counts = counts[i] - popcount(extended, axis=1)
+                keep = extended_counts >= min_count
+                if not keep.any():
+                    extended = None
+            yield (frozenset(itemset), int(counts[i]), extended is None)
+            if extended is not None:
+                stack.append((itemset,
+                              [items[i + 1 + j] for j in keep.nonzero()[0]],
+                              extended[keep],
+                              extended_counts[keep],
+                              diffsets))
+
+
+def mine_eclat(
+        transactions,
+        min_support,
+        maximal_itemsets_only=False,
+        max_length=None,
+        diffsets=False):
+    # As fptree.mine_fp_tree(); returns (itemsets, itemset_counts,
+    # num_transactions). If diffsets is True, mines with dEclat.
+    index = InvertedIndex()
+    index.add_transactions(transactions)
+    min_count = min_support * index.num_transactions
+    itemsets = set()
+    itemset_counts = dict()
+    for (itemset, count, is_leaf) in eclat_search(
+            index, min_count, diffsets, max_length):
+        itemset_counts[itemset] = count
+        if not maximal_itemsets_only or is_leaf:
+            itemsets.add(itemset)
+    return (itemsets, itemset_counts, index.num_transactions)
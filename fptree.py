@@ -1,5 +1,12 @@
+from array import array
+from arrayfptree import ArrayFPTree
+from arrayfptree import ItemCodes
+from closeditemsets import ClosedItemsetCounts
+from closeditemsets import ClosedItemsetFilter
 from collections import Counter
 from collections import deque
+from itertools import combinations
+from multiprocessing import Pool
 from item import Item
 from item import ItemSet
 import time
@@ -10,6 +17,18 @@ if sys.version_info[0] < 3:
 
 LOG_TREE_MUTATIONS = False
 
+FPGrowthMiningAlgorithm = "fpgrowth"
+
+# FP-tree implementations which mine_fp_tree() can build. The "node" tree is
+# made of FPNode objects, the "array" tree stores its nodes in parallel array
+# columns, and uses much less memory.
+NodeTreeEngine = "node"
+ArrayTreeEngine = "array"
+FP_TREE_ENGINES = {
+    NodeTreeEngine: lambda: FPTree(),
+    ArrayTreeEngine: lambda: ArrayFPTree(),
+}
+
 
 class FPNode:
     def __init__(self, item=None, count=0, parent=None):
@@ -54,6 +73,9 @@ class FPTree:
         self.item_count = Counter()
         self.num_transactions = 0
         self.leaves = set()
+        # Position of each item in the order the tree's paths are sorted in,
+        # if known. Shared with conditional trees.
+        self.item_rank = None
 
     def insert(self, transaction, count=1):
         assert(count > 0)
@@ -123,7 +145,8 @@ class FPTree:
             node = child
         assert(node.end_count >= count)
         node.end_count -= count
-        self.leaves.remove(node)
+        if node.end_count == 0:
+            self.leaves.remove(node)
         self.num_transactions -= count
         assert(self.num_transactions >= 0)
 
@@ -139,6 +162,43 @@ class FPTree:
     def __str__(self):
         return "(" + str(self.root) + ")"
 
+    def conditional_tree(self, item, keep=None):
+        return construct_conditional_tree(self, item, keep)
+
+    def prefix_paths(self, item, keep=None):
+        # Iterates over the conditional pattern base of item; the (path, count)
+        # of the path from the root down to each node for item, excluding
+        # the node itself. If keep is passed, only items in it are kept.
+        for node in self.header[item]:
+            path = path_to_root(node.parent)
+            if keep is not None:
+                path = [i for i in path if i in keep]
+            path.reverse()
+            yield (path, node.count)
+
+    def conditional_item_counts(self, item):
+        # Returns the item counts which the conditional tree for item would
+        # have, without building it.
+        counts = Counter()
+        for node in self.header[item]:
+            parent = node.parent
+            while not parent.is_root():
+                counts[parent.item] += node.count
+                parent = parent.parent
+        return counts
+
+    def single_path(self):
+        # If the tree is a single chain of nodes, returns the list of
+        # (item, count) on it in root-to-leaf order, else None.
+        path = []
+        node = self.root
+        while len(node.children) > 0:
+            if len(node.children) > 1:
+                return None
+            node = first_child(node)
+            path.append((node.item, node.count))
+        return path
+
     def __iter__(self):
         # Iterates over (transaction,count), where transaction is
         # in root-to-leaf order.
@@ -154,11 +214,13 @@ def path_to_root(node):
     return path
 
 
-def construct_conditional_tree(tree, item):
+def construct_conditional_tree(tree, item, keep=None):
+    # If keep is passed, only the items in it are kept in the conditional
+    # tree; the others are known to be infrequent in it.
     conditional_tree = FPTree()
-    for node in tree.header[item]:
-        path = path_to_root(node.parent)
-        conditional_tree.insert(reversed(path), node.count)
+    conditional_tree.item_rank = tree.item_rank
+    for (path, count) in tree.prefix_paths(item, keep):
+        conditional_tree.insert(path, count)
     return conditional_tree
 
 
@@ -166,63 +228,348 @@ def first_child(node):
     return list(node.children.values())[0]
 
 
-def fp_growth(
+def single_path_itemsets(single_path, min_count, path, max_length=None):
+    # Every combination of the frequent items on a single path tree is
+    # frequent, with the count of its item furthest from the root. Counts
+    # can only decrease going down the path, so the frequent items are a
+    # prefix of it. Searching this tree would visit the same combinations;
+    # the conditional tree for each item being the path above it. So the
+    # combinations for which the search would find nothing more, and so which
+    # are leaves, are those which include the item nearest the root.
+    # Yields (itemset, count, is_leaf), smaller combinations first.
+    chain = []
+    for (item, count) in single_path:
+        if count < min_count:
+            break
+        chain.append((item, count))
+    max_size = len(chain)
+    if max_length is not None:
+        max_size = min(max_size, max_length - len(path))
+    for size in range(1, max_size + 1):
+        for combination in combinations(range(len(chain)), size):
+            itemset = frozenset(path + [chain[i][0] for i in combination])
+            is_leaf = combination[0] == 0 or size == max_size
+            yield (itemset, chain[combination[-1]][1], is_leaf)
+
+
+def search_order(tree, min_count):
+    # The frequent items in the tree, in the order the search visits them.
+    # When the order the tree's paths are sorted in is known, we visit items
+    # nearest the root first, which ensures every subset of an itemset is
+    # visited before the itemset itself. Otherwise, we visit items in
+    # increasing order of frequency.
+    items = [item for (item, count) in tree.item_count.items()
+             if count >= min_count]
+    if tree.item_rank is not None:
+        return sorted(items, key=tree.item_rank.__getitem__)
+    return sorted(items, key=lambda i: tree.item_count[i])
+
+
+def fp_growth_search(tree, min_count, max_length=None, items=None):
+    # Depth first search for frequent itemsets in tree and its conditional
+    # trees. Uses an explicit stack of (tree, path, items left to visit)
+    # frames rather than recursion, so it can yield each frequent itemset as
+    # it's found. Yields (itemset, count, is_leaf); is_leaf being true if
+    # searching further from the itemset found nothing more, i.e. it's a
+    # maximal itemset. Leaves are known before searching further, since the
+    # search yields at least one more itemset if, and only if, the item has
+    # frequent items in its conditional tree.
+    #
+    # If items is passed, only the itemsets found under those frequent top
+    # level items are yielded. Those depend only on the transactions in the
+    # tree which contain the top level item.
+    if items is None:
+        single_path = tree.single_path()
+        if single_path is not None:
+            yield from single_path_itemsets(
+                single_path, min_count, [], max_length)
+            return
+        items = search_order(tree, min_count)
+
+    stack = [(tree, [], iter(items))]
+    while len(stack) > 0:
+        (tree, path, items) = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            continue
+        itemset_path = path + [item]
+        count = tree.item_count[item]
+        if max_length is not None and len(itemset_path) >= max_length:
+            yield (frozenset(itemset_path), count, True)
+            continue
+
+        # Find which items are frequent in the conditional tree of all
+        # patterns in this tree which start with this item. If there are
+        # none or one, the result of searching it is known without building
+        # the conditional tree.
+        conditional_counts = tree.conditional_item_counts(item)
+        frequent = set(i for (i, count) in conditional_counts.items()
+                       if count >= min_count)
+        yield (frozenset(itemset_path), count, len(frequent) == 0)
+        if len(frequent) == 1:
+            other = frequent.pop()
+            yield (frozenset(itemset_path + [other]),
+                   conditional_counts[other],
+                   True)
+        elif len(frequent) > 1:
+            conditional_tree = tree.conditional_tree(item, frequent)
+            single_path = conditional_tree.single_path()
+            if single_path is not None:
+                yield from single_path_itemsets(
+                    single_path, min_count, itemset_path, max_length)
+            else:
+                stack.append((conditional_tree,
+                              itemset_path,
+                              iter(search_order(conditional_tree, min_count))))
+
+
+def fp_growth(tree, min_count, maximal_only=False, max_length=None):
+    # Lazily yields (itemset, count) for the frequent itemsets in tree, or
+    # only the maximal ones. Itemsets are at most max_length items long, if
+    # passed. For trees built by construct_initial_tree(), every subset of an
+    # itemset is yielded before it.
+    for (itemset, count, is_leaf) in fp_growth_search(
+            tree, min_count, max_length):
+        if not maximal_only or is_leaf:
+            yield (itemset, count)
+
+
+def closed_chain_itemsets(single_path, min_count, path):
+    # Of the combinations of items on a single path tree, only prefixes of
+    # the path can be closed; any other combination skips an item above its
+    # lowest item, and adding that item doesn't change its count. A prefix
+    # is only closed if extending it by the next item reduces its count.
+    # Yields candidate (itemset, count), longest first.
+    chain = []
+    for (item, count) in single_path:
+        if count < min_count:
+            break
+        chain.append((item, count))
+    for length in range(len(chain), 0, -1):
+        count = chain[length - 1][1]
+        if length < len(chain) and chain[length][1] == count:
+            continue
+        yield (frozenset(path + [item for (item, _) in chain[:length]]), count)
+
+
+def fp_growth_closed(tree, min_count):
+    # Yields (itemset, count) for the closed frequent itemsets in tree; those
+    # with no superset of the same count. Like fp_growth_search(), but visits
+    # the items furthest from the root first, and yields each itemset after
+    # searching its conditional tree. That ensures every superset of an
+    # itemset is found before the itemset, so an itemset is closed if no
+    # closed itemset found so far contains it and has its count. Many
+    # itemsets are ruled out before that check; if an item in an itemset's
+    # conditional tree has the itemset's count, the itemset isn't closed.
+    # tree must have come from construct_initial_tree().
+    assert(tree.item_rank is not None)
+    closed = ClosedItemsetFilter()
+
+    def order(tree):
+        return reversed(search_order(tree, min_count))
+
+    single_path = tree.single_path()
+    if single_path is not None:
+        for (itemset, count) in closed_chain_itemsets(
+                single_path, min_count, []):
+            if closed.record_if_closed(itemset, count):
+                yield (itemset, count)
+        return
+
+    # Stack of (tree, path, items left to visit, (itemset, count) to check
+    # once the frame is done).
+    stack = [(tree, [], order(tree), None)]
+    while len(stack) > 0:
+        (tree, path, items, pending) = stack[-1]
+        item = next(items, None)
+        if item is None:
+            stack.pop()
+            if pending is not None and closed.record_if_closed(*pending):
+                yield pending
+            continue
+        itemset_path = path + [item]
+        count = tree.item_count[item]
+        conditional_counts = tree.conditional_item_counts(item)
+        frequent = set(i for (i, count) in conditional_counts.items()
+                       if count >= min_count)
+        if any(conditional_counts[i] == count for i in frequent):
+            pending = None
+        else:
+            pending = (frozenset(itemset_path), count)
+
+        if len(frequent) == 0:
+            single_path = []
+        elif len(frequent) == 1:
+            other = frequent.pop()
+            single_path = [(other, conditional_counts[other])]
+        else:
+            conditional_tree = tree.conditional_tree(item, frequent)
+            single_path = conditional_tree.single_path()
+            if single_path is None:
+                stack.append((conditional_tree,
+                              itemset_path,
+                              order(conditional_tree),
+                              pending))
+                continue
+        for (itemset, itemset_count) in closed_chain_itemsets(
+                single_path, min_count, itemset_path):
+            if closed.record_if_closed(itemset, itemset_count):
+                yield (itemset, itemset_count)
+        if pending is not None and closed.record_if_closed(*pending):
+            yield pending
+
+
+def encode_pattern_base(tree, item, frequent):
+    # Encodes the conditional pattern base of item compactly, so it can be
+    # sent to another process. The frequent items are numbered 0..n-1 in
+    # rank order, and the paths concatenated into one array of those codes,
+    # with offsets[i]:offsets[i+1] spanning the i'th path. Returns
+    # (items, offsets, codes, counts).
+    items = sorted(frequent, key=tree.item_rank.__getitem__)
+    code_of = {item: code for (code, item) in enumerate(items)}
+    offsets = array('i', [0])
+    codes = array('i')
+    counts = array('i')
+    for (path, count) in tree.prefix_paths(item, frequent):
+        codes.extend(code_of[i] for i in path)
+        offsets.append(len(codes))
+        counts.append(count)
+    return (items, offsets, codes, counts)
+
+
+def mine_pattern_base(job):
+    # Runs in a worker process. Builds the conditional tree from an encoded
+    # conditional pattern base, and searches it. The codes are in rank
+    # order, so they serve as their own rank. Returns (job_id, results),
+    # where results is a list of (codes, count, is_leaf).
+    (job_id, engine, offsets, codes, counts, min_count, max_length) = job
+    tree = FP_TREE_ENGINES[engine]()
+    for i in range(len(counts)):
+        tree.insert(codes[offsets[i]:offsets[i + 1]], counts[i])
+    tree.item_rank = {code: code for code in tree.item_count}
+    results = [(tuple(itemset), count, is_leaf)
+               for (itemset, count, is_leaf)
+               in fp_growth_search(tree, min_count, max_length)]
+    return (job_id, results)
+
+
+def fp_growth_parallel(
         tree,
         min_count,
-        path,
-        path_count,
-        itemsets,
-        itemset_counts,
-        maximal_only=False):
-    # For each item in the tree that is frequent, in increasing order
-    # of frequency...
-    for item in sorted(
-            tree.item_count.keys(),
-            key=lambda i: tree.item_count[i]):
-        if tree.item_count[item] < min_count:
-            # Item is no longer frequent on this path, skip.
+        workers,
+        engine=NodeTreeEngine,
+        max_length=None):
+    # Like fp_growth_search(), but the conditional trees of the top level
+    # items are searched in a pool of worker processes. Each worker is sent
+    # an encoded conditional pattern base, rather than the tree. Itemsets
+    # are yielded as workers finish, so subsets aren't necessarily yielded
+    # before the itemsets containing them. tree must have come from
+    # construct_initial_tree().
+    assert(tree.item_rank is not None)
+    single_path = tree.single_path()
+    if single_path is not None:
+        yield from single_path_itemsets(single_path, min_count, [], max_length)
+        return
+
+    jobs = []
+    job_items = []
+    for item in search_order(tree, min_count):
+        count = tree.item_count[item]
+        if max_length is not None and max_length <= 1:
+            yield (frozenset([item]), count, True)
             continue
-
-        # Need to store the support of this itemset, so we
-        # can look it up during rule generation later on.
-        itemset = frozenset(path + [item])
-        new_path_count = min(path_count, tree.item_count[item])
-        assert(itemset not in itemset_counts)
-        itemset_counts[itemset] = new_path_count
-
-        # Build conditional tree of all patterns in this tree which start
-        # with this item.
-        conditional_tree = construct_conditional_tree(tree, item)
-        num_itemsets = len(itemsets)
-        fp_growth(
-            conditional_tree,
-            min_count,
-            path + [item],
-            new_path_count,
-            itemsets,
-            itemset_counts,
-            maximal_only)
-
-        # Add the path to here to the output set, if appropriate.
-        # If recursing further didn't yield any more itemsets, then
-        # this is a maximal itemset.
-        if not maximal_only or len(itemsets) == num_itemsets:
-            itemsets.add(itemset)
-
-
-def mine_fp_tree(transactions, min_support, maximal_itemsets_only=False):
-    (tree, num_transactions) = construct_initial_tree(transactions, min_support)
+        conditional_counts = tree.conditional_item_counts(item)
+        frequent = set(i for (i, count) in conditional_counts.items()
+                       if count >= min_count)
+        yield (frozenset([item]), count, len(frequent) == 0)
+        # Conditional trees with at most one frequent item are resolved here
+        # rather than being sent to a worker.
+        if len(frequent) == 1:
+            other = frequent.pop()
+            yield (frozenset([item, other]), conditional_counts[other], True)
+        elif len(frequent) > 1:
+            (items, offsets, codes, counts) = encode_pattern_base(
+                tree, item, frequent)
+            job_id = len(jobs)
+            job_items.append((item, items))
+            jobs.append((job_id,
+                         engine,
+                         offsets,
+                         codes,
+                         counts,
+                         min_count,
+                         None if max_length is None else max_length - 1))
+
+    # Send the largest pattern bases first, so that no worker is left
+    # processing a large one after the rest are done.
+    jobs.sort(key=lambda job: len(job[3]), reverse=True)
+    with Pool(workers) as pool:
+        for (job_id, results) in pool.imap_unordered(mine_pattern_base, jobs):
+            (item, items) = job_items[job_id]
+            for (codes, count, is_leaf) in results:
+                itemset = frozenset([item] + [items[code] for code in codes])
+                yield (itemset, count, is_leaf)
+
+
+def mine_fp_tree_iter(
+        transactions,
+        min_support,
+        maximal_itemsets_only=False,
+        engine=NodeTreeEngine,
+        max_length=None):
+    # Returns (itemsets, num_transactions), where itemsets is an iterator
+    # over (itemset, count) which mines the tree as it's consumed.
+    (tree, num_transactions) = construct_initial_tree(
+        transactions, min_support, engine)
+    min_count = min_support * num_transactions
+    itemsets = fp_growth(tree, min_count, maximal_itemsets_only, max_length)
+    return (itemsets, num_transactions)
+
+
+def mine_fp_tree(
+        transactions,
+        min_support,
+        maximal_itemsets_only=False,
+        engine=NodeTreeEngine,
+        max_length=None,
+        workers=None,
+        closed_itemsets_only=False):
+    # If workers is greater than 1, the tree is mined in that many
+    # processes.
+    #
+    # If closed_itemsets_only is true, only closed itemsets are returned, and
+    # itemset_counts is a ClosedItemsetCounts, which derives the count of any
+    # other frequent itemset from the closed itemsets when it's looked up.
+    if closed_itemsets_only and (maximal_itemsets_only or
+                                 max_length is not None or
+                                 (workers is not None and workers > 1)):
+        raise ValueError(
+            "Closed itemset mining can't be combined with maximal itemsets, "
+            "a maximum itemset length, or worker processes")
+    (tree, num_transactions) = construct_initial_tree(
+        transactions, min_support, engine)
     min_count = min_support * num_transactions
+    if closed_itemsets_only:
+        itemset_counts = ClosedItemsetCounts()
+        for (itemset, count) in fp_growth_closed(tree, min_count):
+            itemset_counts.add(itemset, count)
+        return (set(itemset_counts.keys()), itemset_counts, num_transactions)
+    if workers is not None and workers > 1:
+        search = fp_growth_parallel(
+            tree, min_count, workers, engine, max_length)
+    else:
+        search = fp_growth_search(tree, min_count, max_length)
     itemsets = set()
+    # Need to store the support of every frequent itemset, even those
+    # which aren't maximal, so we can look it up during rule generation
+    # later on.
     itemset_counts = dict()
-    fp_growth(
-        tree,
-        min_count,
-        [],
-        num_transactions,
-        itemsets,
-        itemset_counts,
-        maximal_itemsets_only)
+    for (itemset, count, is_leaf) in search:
+        assert(itemset not in itemset_counts)
+        itemset_counts[itemset] = count
+        if not maximal_itemsets_only or is_leaf:
+            itemsets.add(itemset)
     return (itemsets, itemset_counts, num_transactions)
 
 
@@ -253,15 +600,42 @@ def count_item_frequency_in(transactions):
     return (frequency, num_transactions)
 
 
-def construct_initial_tree(transactions, min_support):
-    (frequency, num_transactions) = count_item_frequency_in(transactions)
+def construct_initial_tree(transactions, min_support, engine=NodeTreeEngine):
+    # Reads the transactions only once, so they can be a one-shot iterator.
+    # We count the distinct transactions in a hash table, keyed by their
+    # item codes in sorted order, so identical transactions are only stored
+    # and inserted once. Then we count item frequencies from the distinct
+    # transactions, and build the frequency ordered tree in bulk from them,
+    # so there's no need to sort() the tree afterwards.
+    if engine not in FP_TREE_ENGINES:
+        raise ValueError("Unknown FP-tree engine {}".format(engine))
+    codes = ItemCodes()
+    code = codes.code
+    staging = Counter(tuple(sorted(map(code, transaction)))
+                      for transaction in transactions)
+    num_transactions = sum(staging.values())
     min_count = num_transactions * min_support
-    tree = FPTree()
-    for transaction in transactions:
-        # Remove infrequent items from transaction. They cannot contribute to
-        # producing frequent itemsets, and just slow down the tree algorithms.
-        transaction = filter(
-            lambda item: frequency[item] >= min_count,
-            transaction)
-        tree.insert(sort_transaction(transaction, frequency))
+    item_of = codes.item_of
+    code_count = [0] * len(item_of)
+    for (path, count) in staging.items():
+        for c in path:
+            code_count[c] += count
+    frequency = Counter(dict(zip(item_of, code_count)))
+
+    # Rank the frequent items in sort_transaction() order, so each path can
+    # be filtered and sorted with a single lookup per item. Infrequent items
+    # cannot contribute to producing frequent itemsets, and just slow down
+    # the tree algorithms, so they have no rank and are dropped.
+    rank = [None] * len(item_of)
+    ordered = sort_transaction(
+        [item for item in item_of if frequency[item] >= min_count], frequency)
+    for (position, item) in enumerate(ordered):
+        rank[codes.code_of[item]] = position
+
+    tree = FP_TREE_ENGINES[engine]()
+    tree.item_rank = {item: position for (position, item) in enumerate(ordered)}
+    for (path, count) in staging.items():
+        path = sorted((c for c in path if rank[c] is not None),
+                      key=rank.__getitem__)
+        tree.insert([item_of[c] for c in path], count)
     return (tree, num_transactions)
@@ -1,5 +1,5 @@
-from item import ItemSet
-from itertools import chain, combinations
+from closeditemsets import ClosedItemsetCounts
+from itertools import combinations
 import sys
 
 
@@ -7,20 +7,39 @@ if sys.version_info[0] < 3:
     raise Exception("Python 3 or a more recent version is required.")
 
 
-# Modified version of itertools powerset recipie; this version outputs all
-# subsets of size >= 1 and size <= len(iterable)-1. The later condition
-# ensures that we can subtract the sets in the powerset from the itemset
-# and have a non-empty remainder to act as the consequent in generate_rules
-# below.
-def powerset(iterable):
-    s = list(iterable)
-    return chain.from_iterable(
-        combinations(
-            s, r) for r in range(
-            1, len(s) + 1))
+def grow_consequents(consequents):
+    # Returns the consequents one item larger than those passed, all of
+    # whose subsets one item smaller were passed. A rule can't meet the
+    # minimum confidence unless every rule from the same itemset with a
+    # smaller consequent does, so these are the only candidates.
+    consequents = set(consequents)
+    result = set()
+    for (a, b) in combinations(consequents, 2):
+        consequent = a | b
+        if (len(consequent) == len(a) + 1 and consequent not in result
+                and all(consequent - {item} in consequents
+                        for item in consequent)):
+            result.add(consequent)
+    return result
+
 
 # Return the set of (antecedent, consequent, confidence, lift, support),
-# for all rules that can be generated from set of item sets.
+# for all rules that can be generated from set of item sets. That is, for
+# every itemset which is a subset of one of itemsets, each rule whose
+# antecedent and consequent partition it. Consequents have at most
+# max_consequent_size items.
+#
+# Each distinct itemset is visited once; starting from each of itemsets, we
+# visit the antecedents of its single item consequent rules which haven't been
+# visited yet. If itemset_counts is a ClosedItemsetCounts, itemsets are
+# closed, and the subsets of a closed itemset which have it as their
+# closure are those with the same count, so we only visit those from each
+# closed itemset. A subset with a larger count has a different closure, as
+# do all its subsets.
+#
+# For each itemset, consequents are grown an item at a time from those
+# whose rules meet the minimum confidence, since removing items from an
+# antecedent can only lower the rule's confidence.
 
 
 def generate_rules(
@@ -28,29 +47,105 @@ def generate_rules(
         itemset_counts,
         num_transactions,
         min_confidence,
-        min_lift):
+        min_lift,
+        max_consequent_size=1):
     if not isinstance(itemset_counts, dict):
         raise TypeError("argument itemset_counts must be dict")
     result = set()
+    closed = isinstance(itemset_counts, ClosedItemsetCounts)
+    visited = set()
+    consequent_supports = dict()
 
     def calculate_support(i):
         return itemset_counts[i] / num_transactions
 
-    for itemset in itemsets:
-        if len(itemset) < 2:
+    def consequent_support(i):
+        if i not in consequent_supports:
+            consequent_supports[i] = calculate_support(i)
+        return consequent_supports[i]
+
+    for root in itemsets:
+        if len(root) < 2:
             continue
-        for item in itemset:
-            consequent = frozenset([item])
-            for antecedent in (frozenset(x)
-                               for x in powerset(itemset - consequent)):
-                assert(len(antecedent) > 0)
-                assert(len(consequent) == 1)
-                support = calculate_support(antecedent | consequent)
+        if closed:
+            visited = set()
+            root_count = itemset_counts[root]
+        elif root in visited:
+            continue
+        visited.add(root)
+        stack = [root]
+        while len(stack) > 0:
+            itemset = stack.pop()
+            support = calculate_support(itemset)
+            consequents = []
+            for item in itemset:
+                consequent = frozenset([item])
+                antecedent = itemset - consequent
+                if (len(antecedent) > 1 and antecedent not in visited and
+                        (not closed or
+                         itemset_counts[antecedent] == root_count)):
+                    visited.add(antecedent)
+                    stack.append(antecedent)
                 confidence = support / calculate_support(antecedent)
                 if confidence < min_confidence:
                     continue
-                lift = confidence / calculate_support(consequent)
+                consequents.append(consequent)
+                lift = confidence / consequent_support(consequent)
                 if lift < min_lift:
                     continue
                 result.add((antecedent, consequent, confidence, lift, support))
+
+            size = 1
+            while (len(consequents) > 0 and size < max_consequent_size and
+                   size + 1 < len(itemset)):
+                candidates = grow_consequents(consequents)
+                consequents = []
+                for consequent in candidates:
+                    antecedent = itemset - consequent
+                    confidence = support / calculate_support(antecedent)
+                    if confidence < min_confidence:
+                        continue
+                    consequents.append(consequent)
+                    lift = confidence / consequent_support(consequent)
+                    if lift < min_lift:
+                        continue
+                    result.add(
+                        (antecedent, consequent, confidence, lift, support))
+                size += 1
     return result
+
+
+# Yields the (antecedent, consequent, confidence, lift, support) rules with a
+# single item consequent, from a stream of (itemset, count) such as
+# fptree.fp_growth() produces. The stream must contain every frequent
+# itemset, and every subset of an itemset must come before it. Each rule is
+# generated when the union of its antecedent and consequent arrives, so
+# rules are produced while the itemsets are still being mined. Only the
+# itemset counts are retained.
+
+
+def generate_rules_from_stream(
+        itemset_stream,
+        num_transactions,
+        min_confidence,
+        min_lift):
+    itemset_counts = dict()
+
+    def calculate_support(i):
+        return itemset_counts[i] / num_transactions
+
+    for (itemset, count) in itemset_stream:
+        itemset_counts[itemset] = count
+        if len(itemset) < 2:
+            continue
+        support = calculate_support(itemset)
+        for item in itemset:
+            consequent = frozenset([item])
+            antecedent = itemset - consequent
+            confidence = support / calculate_support(antecedent)
+            if confidence < min_confidence:
+                continue
+            lift = confidence / calculate_support(consequent)
+            if lift < min_lift:
+                continue
+            yield (antecedent, consequent, confidence, lift, support)
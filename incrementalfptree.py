@@ -0,0 +1,144 @@
+from collections import deque
+from fptree import FPTree
+from fptree import fp_growth_search
+from fptree import sort_transaction
+import sys
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+
+class IncrementalFPGrowth:
+    # Maintains an FP-tree of the last window_size transactions added, and
+    # mines it incrementally. The itemsets found under each top level item of
+    # the tree depend only on the transactions containing that item, so
+    # they're cached, and after the window slides only the items in the
+    # transactions added or expired since the last mine() are searched again.
+    #
+    # Item frequencies change as the window slides, so paths in the tree are
+    # kept sorted in the frequency order as of the last time the tree was
+    # rebuilt, with items first seen since then ordered after the rest. That
+    # order doesn't change as transactions are added and expired, so the
+    # cached itemsets stay valid. When most of the tree needs searching again
+    # anyway, it's rebuilt in the current frequency order, so that it
+    # compresses as well as a tree built from scratch. Whether an itemset is
+    # maximal depends on that order too, so maximal itemsets are picked out
+    # afterwards, by the current frequency order, as mine_fp_tree() would.
+    def __init__(self, window_size, min_support):
+        assert(window_size > 0)
+        self.window_size = window_size
+        self.min_support = min_support
+        self.tree = FPTree()
+        self.tree.item_rank = dict()
+        self.window = deque()
+        # Items in transactions added or expired since the last mine().
+        self.changed = set()
+        # Map of top level item to the (itemset, count, is_leaf) found under
+        # it, as of the last mine().
+        self.branches = dict()
+        self.min_count = None
+        self.max_length = None
+        # Fraction of the frequent items which must need searching again
+        # before mine() rebuilds the tree.
+        self.rebuild_fraction = 0.5
+
+    def __len__(self):
+        return len(self.window)
+
+    def add(self, transaction):
+        # Adds a transaction to the window. If the window is then larger than
+        # window_size, the oldest transaction expires.
+        rank = self.tree.item_rank
+        for item in transaction:
+            if item not in rank:
+                rank[item] = len(rank)
+        path = sorted(transaction, key=rank.__getitem__)
+        if len(path) > 0:
+            self.tree.insert(path)
+        self.window.append(path)
+        self.changed.update(path)
+        if len(self.window) > self.window_size:
+            self.expire(1)
+
+    def expire(self, count):
+        # Removes the oldest count transactions from the window.
+        for _ in range(min(count, len(self.window))):
+            path = self.window.popleft()
+            if len(path) > 0:
+                self.tree.remove(path, 1)
+            self.changed.update(path)
+
+    def rebuild(self):
+        # Rebuilds the tree with its paths sorted by the current item
+        # frequencies. The cached itemsets are only valid for the tree they
+        # were found in, so they're discarded.
+        frequency = self.tree.item_count
+        ordered = sort_transaction(
+            [item for (item, count) in frequency.items() if count > 0],
+            frequency)
+        rank = {item: position for (position, item) in enumerate(ordered)}
+        self.tree = FPTree()
+        self.tree.item_rank = rank
+        self.window = deque(sorted(path, key=rank.__getitem__)
+                            for path in self.window)
+        for path in self.window:
+            if len(path) > 0:
+                self.tree.insert(path)
+        self.branches.clear()
+
+    def mine(self, maximal_itemsets_only=False, max_length=None):
+        # Returns (itemsets, itemset_counts, num_transactions) for the
+        # transactions in the window, as fptree.mine_fp_tree() does.
+        num_transactions = len(self.window)
+        min_count = self.min_support * num_transactions
+        if min_count != self.min_count or max_length != self.max_length:
+            # Which itemsets are frequent may have changed under every item.
+            self.branches.clear()
+            self.min_count = min_count
+            self.max_length = max_length
+        for item in self.changed:
+            self.branches.pop(item, None)
+        self.changed.clear()
+
+        frequent = self.frequent_items(min_count)
+        stale = [item for item in frequent if item not in self.branches]
+        if len(stale) > self.rebuild_fraction * len(frequent):
+            self.rebuild()
+            frequent = self.frequent_items(min_count)
+        for item in frequent:
+            if item not in self.branches:
+                self.branches[item] = list(fp_growth_search(
+                    self.tree, min_count, max_length, [item]))
+        for item in set(self.branches) - set(frequent):
+            del self.branches[item]
+
+        itemset_counts = dict()
+        for branch in self.branches.values():
+            for (itemset, count, is_leaf) in branch:
+                itemset_counts[itemset] = count
+        if maximal_itemsets_only:
+            itemsets = self.maximal_itemsets(itemset_counts)
+        else:
+            itemsets = set(itemset_counts)
+        return (itemsets, itemset_counts, num_transactions)
+
+    def maximal_itemsets(self, itemset_counts):
+        # mine_fp_tree() searches items nearest the root of its tree first,
+        # in sort_transaction() order, and an itemset is a leaf of its search
+        # unless adding an item ranked before all of its items is frequent.
+        # So the itemsets which aren't leaves are those left by removing the
+        # first ranked item from each frequent itemset.
+        frequent = [item for itemset in itemset_counts if len(itemset) == 1
+                    for item in itemset]
+        rank = {item: position for (position, item) in enumerate(
+            sort_transaction(frequent, self.tree.item_count))}
+        extended = set()
+        for itemset in itemset_counts:
+            if len(itemset) > 1:
+                extended.add(itemset - {min(itemset, key=rank.__getitem__)})
+        return set(itemset for itemset in itemset_counts
+                   if itemset not in extended)
+
+    def frequent_items(self, min_count):
+        return [item for (item, count) in self.tree.item_count.items()
+                if count > 0 and count >= min_count]
@@ -1,52 +1,181 @@
-import csv
+import numpy
+from collections import OrderedDict
 from item import Item
+from item import is_item
+from transactionstore import TransactionStore
+from transactionstore import read_csv_chunks
+from transactionstore import sort_rows
+from transactionstore import split_rows
 import sys
 
 if sys.version_info[0] < 3:
     raise Exception("Python 3 or a more recent version is required.")
 
 
+# Default number of bytes of intersections of itemsets' prefixes kept by an
+# InvertedIndex. Each is a bitmap of one bit per transaction, so this is
+# about 512 of them at a million transactions.
+INTERSECTION_CACHE_BYTES = 1 << 26
+
+# Number of set bits in each byte, for counting bits where NumPy doesn't
+# have bitwise_count().
+BYTE_POPCOUNT = numpy.array([bin(i).count("1") for i in range(256)],
+                            dtype=numpy.uint8)
+
+
+def popcount(bitmap, axis=None):
+    # Returns the number of set bits in bitmap, an array of uint8, or along
+    # the given axis of it.
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(bitmap).sum(axis=axis, dtype=numpy.int64)
+    return BYTE_POPCOUNT[bitmap].sum(axis=axis, dtype=numpy.int64)
+
+
 class InvertedIndex:
-    def __init__(self):
+    # Maps each item, an Item or a Vocabulary id, to the transactions
+    # containing it. Transactions are numbered in the order they're added,
+    # in batches, and each item's transaction numbers are kept as a sorted
+    # array per batch. They're packed into a bitmap, one bit per
+    # transaction, when the item is first counted after adding
+    # transactions. Itemsets are counted by intersecting their items'
+    # bitmaps in sorted item order, with the intersections of itemsets'
+    # prefixes kept in a least recently used cache of up to cache_bytes of
+    # bitmaps, so that counting a|b after a reuses a's intersection.
+    def __init__(self, cache_bytes=INTERSECTION_CACHE_BYTES):
         self.index = dict()
         self.num_transactions = 0
+        self.bitmaps = dict()
+        self.intersections = OrderedDict()
+        self.cache_bytes = cache_bytes
 
     def add(self, transaction):
-        self.num_transactions += 1
-        for item in transaction:
-            if not isinstance(item, Item):
-                raise TypeError("Item name must be Item")
-            if item not in self.index:
-                self.index[item] = set()
-            self.index[item].add(self.num_transactions)
+        self.add_transactions([transaction])
+
+    def add_transactions(self, transactions):
+        # Adds a batch of transactions; a TransactionStore, whose item ids
+        # are added as they are, or an iterable of transactions of Items or
+        # Vocabulary ids.
+        if isinstance(transactions, TransactionStore):
+            keys = range(int(transactions.items.max()) + 1
+                         if len(transactions.items) > 0 else 0)
+            self.add_batch(transactions.offsets, transactions.items, keys)
+            return
+        ids = dict()
+        items = []
+        offsets = [0]
+        for transaction in transactions:
+            transaction = dict.fromkeys(transaction)
+            for item in transaction:
+                if item not in ids:
+                    if not is_item(item):
+                        raise TypeError("Item name must be Item")
+                    ids[item] = len(ids)
+            items.extend(map(ids.__getitem__, transaction))
+            offsets.append(len(items))
+        self.add_batch(numpy.array(offsets, dtype=numpy.int64),
+                       numpy.array(items, dtype=numpy.int64),
+                       list(ids))
+
+    def add_batch(self, offsets, ids, keys):
+        # Adds a batch of transactions in compressed sparse row form; the
+        # ids of transaction i's items are ids[offsets[i]:offsets[i + 1]],
+        # which must be distinct, and keys[id] is the item with that id.
+        # Sorting the items' occurrences by id, stably, groups each item's
+        # transaction numbers together, still in increasing order.
+        num_transactions = len(offsets) - 1
+        transaction_ids = numpy.repeat(
+            numpy.arange(self.num_transactions,
+                         self.num_transactions + num_transactions),
+            numpy.diff(offsets))
+        if len(keys) <= 1 << 16:
+            # NumPy sorts 16 bit integers stably with a radix sort.
+            ids = ids.astype(numpy.uint16)
+        transaction_ids = transaction_ids[numpy.argsort(ids, kind="stable")]
+        counts = numpy.bincount(ids, minlength=len(keys))
+        ends = numpy.cumsum(counts)
+        for (key, end, count) in zip(keys, ends.tolist(), counts.tolist()):
+            if count > 0:
+                self.index.setdefault(key, []).append(
+                    transaction_ids[end - count:end])
+        self.num_transactions += num_transactions
+        if len(self.bitmaps) > 0:
+            self.bitmaps.clear()
+            self.intersections.clear()
 
     def load(self, data):
         if not isinstance(data, str):
             raise TypeError("InvertedIndex.load() expects a string")
-        for transaction in data.splitlines():
-            self.add([Item(s) for s in transaction.split(",")])
+        self.add_rows([split_rows(data.encode())])
 
     def load_csv(self, csvFilePath):
         if not isinstance(csvFilePath, str):
             raise TypeError(
                 "InvertedIndex.load_csv() expects a path as string")
-        with open(csvFilePath, newline='') as csvfile:
-            reader = csv.reader(csvfile)
-            for line in reader:
-                transaction = map(Item, line)
-                self.add(transaction)
+        self.add_rows(read_csv_chunks(csvFilePath))
+
+    def add_rows(self, chunks):
+        # Adds the transactions in chunks of (fields, tokens), as
+        # transactionstore.split_rows() returns them, making one Item for
+        # each distinct item name.
+        ids = dict()
+        keys = []
+        for (fields, tokens) in chunks:
+            for name in dict.fromkeys(tokens):
+                if name not in ids:
+                    ids[name] = len(ids)
+                    keys.append(Item(name.decode()))
+            items = numpy.fromiter(map(ids.__getitem__, tokens),
+                                   dtype=numpy.int64,
+                                   count=len(tokens))
+            offsets = numpy.zeros(len(fields) + 1, dtype=numpy.int64)
+            numpy.cumsum(fields, out=offsets[1:])
+            (offsets, items) = sort_rows(offsets, items, dedupe=True)
+            self.add_batch(offsets, items, keys)
 
     def items(self):
         return self.index.keys()
 
+    def transaction_ids(self, item):
+        # Returns the sorted array of the numbers of the transactions
+        # containing item, joining the arrays added in batches.
+        batches = self.index[item]
+        if len(batches) > 1:
+            batches[:] = [numpy.concatenate(batches)]
+        return batches[0]
+
+    def bitmap(self, item):
+        bitmap = self.bitmaps.get(item)
+        if bitmap is None:
+            bits = numpy.zeros(self.num_transactions, dtype=bool)
+            bits[self.transaction_ids(item)] = True
+            bitmap = numpy.packbits(bits)
+            self.bitmaps[item] = bitmap
+        return bitmap
+
+    def intersection(self, items):
+        # Returns the bitmap of the transactions containing all of items, a
+        # sorted tuple.
+        if len(items) == 1:
+            return self.bitmap(items[0])
+        bitmap = self.intersections.get(items)
+        if bitmap is not None:
+            self.intersections.move_to_end(items)
+            return bitmap
+        bitmap = numpy.bitwise_and(self.intersection(items[:-1]),
+                                   self.bitmap(items[-1]))
+        self.intersections[items] = bitmap
+        # Bitmaps are all the same size, one bit per transaction.
+        while len(self.intersections) * bitmap.nbytes > self.cache_bytes:
+            self.intersections.popitem(last=False)
+        return bitmap
+
     def count(self, itemset):
         for item in itemset:
-            if not isinstance(item, Item):
+            if not is_item(item):
                 raise TypeError("Itemset must contain only Items")
         if not isinstance(itemset, set) and not isinstance(itemset, frozenset):
             raise TypeError("InvertedIndex.support() expects a set of items")
-        return len(set.intersection(*[self.index[i]
-                                      for i in itemset]))
+        return int(popcount(self.intersection(tuple(sorted(itemset)))))
 
     def support(self, itemset):
         return self.count(itemset) / self.num_transactions
@@ -1,4 +1,5 @@
 import sys
+from array import array
 
 if sys.version_info[0] < 3:
     raise Exception("Python 3 or a more recent version is required.")
@@ -36,3 +37,46 @@ class Item:
 
 def ItemSet(lst):
     return frozenset(map(Item, lst))
+
+
+def is_item(value):
+    # Items flowing through the pipeline are either Item objects, or plain
+    # integer ids handed out by a Vocabulary.
+    return isinstance(value, (Item, int))
+
+
+class Vocabulary:
+    # Interns item names to dense integer ids, starting at 0. Unlike Item,
+    # which resolves names through the module-global tables above, each
+    # Vocabulary is independent, and the ids it hands out are plain ints, so
+    # transactions can be stored as compact array('i') and compared and
+    # hashed without any dict lookups. Names are only needed again when
+    # writing output.
+    def __init__(self):
+        self.name_to_id = {}
+        self.id_to_name = []
+
+    def __len__(self):
+        return len(self.id_to_name)
+
+    def intern(self, name):
+        if not isinstance(name, str):
+            raise TypeError("Item name must be string")
+        name = name.strip()
+        item_id = self.name_to_id.get(name)
+        if item_id is None:
+            item_id = len(self.id_to_name)
+            self.name_to_id[name] = item_id
+            self.id_to_name.append(name)
+        return item_id
+
+    def name_of(self, item_id):
+        return self.id_to_name[item_id]
+
+    def encode(self, names):
+        # Returns the transaction as an array of its unique item ids, in
+        # increasing id order.
+        return array('i', sorted(set(map(self.intern, names))))
+
+    def decode(self, item_ids):
+        return [self.id_to_name[i] for i in item_ids]
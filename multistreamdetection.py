@@ -0,0 +1,196 @@
+# Runs virtual change detection over many independent transaction streams
+# at once, each stream running in a process from a pool, and reports all
+# the streams' drifts and metrics together.
+#
+# Example usage:
+#   $ python3 multistreamdetection.py \
+#       --inputs stores/*.csv \
+#       --output rules.csv \
+#       --min-confidence 0.05 \
+#       --min-support 0.001 \
+#       --min-lift 1.0 \
+#       --training-window-size 2500 \
+#       --drift-algorithm prochange \
+#       --processes 8
+
+import os
+import sys
+import time
+from argparse import Namespace
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Queue
+from queue import Empty
+from virtualchangedetection import check_args
+from virtualchangedetection import detect_drifts
+from virtualchangedetection import make_arg_parser
+from virtualchangedetection import quiet
+
+# Messages sent from the stream processes to the driver.
+DriftMessage = "drift"
+DoneMessage = "done"
+ErrorMessage = "error"
+
+METRICS = [
+    "transactions",
+    "windows",
+    "rules",
+    "drifts",
+    "mining_seconds",
+    "runtime_seconds",
+]
+
+# Queue through which a pool process reports on its streams.
+report_queue = None
+
+
+def init_stream_process(queue):
+    global report_queue
+    report_queue = queue
+    # The streams' progress output would be interleaved; only their drifts
+    # and metrics are reported, through the queue.
+    sys.stdout = open(os.devnull, "w")
+
+
+def stream_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def stream_args(args, path):
+    # Each stream's rules are written to files prefixed by the output
+    # prefix and the stream's name.
+    stream = Namespace(**vars(args))
+    stream.input = path
+    stream.output = "{}.{}".format(args.output, stream_name(path))
+    return stream
+
+
+def run_stream(job):
+    (name, args) = job
+    metrics = Counter()
+    start = time.time()
+    try:
+        for (transaction_num, drift) in detect_drifts(args, quiet, metrics):
+            report_queue.put((DriftMessage, name, transaction_num, drift))
+    except Exception as exception:
+        report_queue.put((ErrorMessage, name, repr(exception)))
+        return
+    metrics["runtime_seconds"] = time.time() - start
+    report_queue.put((DoneMessage, name, metrics))
+
+
+def run_streams(args, inputs, processes=None):
+    # Runs detect_drifts() over each of the input files in a pool of
+    # processes, and yields the messages the streams report as they arrive:
+    # (DriftMessage, name, transaction_num, drift) for each drift,
+    # (DoneMessage, name, metrics) when a stream ends, or
+    # (ErrorMessage, name, error) if it fails.
+    names = list(map(stream_name, inputs))
+    if len(set(names)) != len(names):
+        raise ValueError("Input files' names must be distinct")
+    # Each process runs one stream at a time, start to finish, and takes the
+    # next when it's done; the only scheduling is the order streams start
+    # in. Starting the largest files first stops a long stream from being
+    # left running on its own after the others have finished.
+    inputs = sorted(inputs, key=os.path.getsize, reverse=True)
+    jobs = [(stream_name(path), stream_args(args, path)) for path in inputs]
+    queue = Queue()
+    with ProcessPoolExecutor(processes,
+                             initializer=init_stream_process,
+                             initargs=(queue,)) as executor:
+        running = {name: executor.submit(run_stream, (name, args))
+                   for (name, args) in jobs}
+        while len(running) > 0:
+            try:
+                message = queue.get(timeout=1)
+            except Empty:
+                # A stream whose process died, say killed for running out
+                # of memory, can't report its failure itself.
+                for (name, future) in list(running.items()):
+                    if future.done() and future.exception() is not None:
+                        del running[name]
+                        yield (ErrorMessage, name, repr(future.exception()))
+                continue
+            if message[0] != DriftMessage:
+                running.pop(message[1], None)
+            yield message
+
+
+def main():
+    parser = make_arg_parser(
+        "Association rule data mining in Python - Virtual change detection "
+        "over multiple streams",
+        input_args=False)
+    parser.add_argument("--inputs", dest="inputs", nargs="+", required=True)
+    parser.add_argument("--output", dest="output", required=True)
+    parser.add_argument(
+        "--processes",
+        dest="processes",
+        type=int,
+        required=False,
+        default=None)
+    parser.add_argument(
+        "--metrics-output",
+        dest="metrics_output",
+        required=False,
+        default=None)
+    args = parser.parse_args()
+    check_args(args)
+    if args.workers is not None and args.workers > 1:
+        # Pool processes can't start processes of their own.
+        print("--workers can't be used with multiple streams.")
+        sys.exit(-1)
+    program_start = time.time()
+
+    print("Virtual Change/Drift Detection over {} streams.".format(
+        len(args.inputs)))
+    print("Drift Algorithm: {}".format(args.drift_algorithm))
+    print("Output file prefix: {}".format(args.output))
+    print("Processes: {}".format(args.processes or os.cpu_count()))
+
+    totals = Counter()
+    stream_metrics = []
+    failed = 0
+    for message in run_streams(args, args.inputs, args.processes):
+        if message[0] == DriftMessage:
+            (_, name, transaction_num, drift) = message
+            print("[{}] Detected drift of type {} at transaction {}".format(
+                name, drift.drift_type, transaction_num), flush=True)
+        elif message[0] == DoneMessage:
+            (_, name, metrics) = message
+            stream_metrics.append((name, metrics))
+            totals.update(metrics)
+            print(
+                "[{}] Finished {} transactions in {} windows with {} drifts "
+                "in {:.2f} seconds".format(
+                    name,
+                    metrics["transactions"],
+                    metrics["windows"],
+                    metrics["drifts"],
+                    metrics["runtime_seconds"]),
+                flush=True)
+        else:
+            (_, name, error) = message
+            failed += 1
+            print("[{}] Failed: {}".format(name, error), flush=True)
+
+    if args.metrics_output is not None:
+        with open(args.metrics_output, "w") as metrics_file:
+            metrics_file.write("stream," + ",".join(METRICS) + "\n")
+            for (name, metrics) in sorted(stream_metrics):
+                metrics_file.write(name + "," + ",".join(
+                    str(metrics[metric]) for metric in METRICS) + "\n")
+
+    print("\nEnd of streams\n")
+    print("Streams: {} finished, {} failed".format(len(stream_metrics), failed))
+    print("Total transactions: {}".format(totals["transactions"]))
+    print("Total drifts: {}".format(totals["drifts"]))
+    print("Total mining time {:.2f} seconds".format(totals["mining_seconds"]))
+    duration = time.time() - program_start
+    print("Total runtime {:.2f} seconds".format(duration))
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
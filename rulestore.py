@@ -0,0 +1,255 @@
+import gzip
+import numpy
+from array import array
+from item import Item
+from ruletree import RuleTree
+import sys
+import zipfile
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+CsvRuleFormat = "csv"
+BinaryRuleFormat = "binary"
+
+CSV_HEADER = "Antecedent->Consequent,Confidence,Lift,Support\n"
+
+# Number of CSV lines buffered before they're written out.
+CSV_WRITE_BATCH_SIZE = 4096
+
+# Number of rules written out in each block of a binary rules file's
+# columns.
+BINARY_WRITE_BLOCK_SIZE = 1 << 16
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZIP_MAGIC = b"PK"
+
+
+def set_to_string(s, vocabulary=None):
+    # Items are either Items, or ids interned in vocabulary. Either way, we
+    # write them out sorted by name.
+    if vocabulary is not None:
+        names = map(vocabulary.name_of, s)
+    else:
+        names = map(str, s)
+    return " ".join(sorted(names))
+
+
+def vocabulary_path(path):
+    return path + ".vocab"
+
+
+class CsvRuleWriter:
+    # Writes rules one per line as "antecedent -> consequent,confidence,
+    # lift,support", with items written by name. Lines are formatted and
+    # written in batches as rules are passed in.
+    def __init__(self, path, vocabulary=None, compress=False):
+        self.vocabulary = vocabulary
+        if compress:
+            self.file = gzip.open(path, "wt")
+        else:
+            self.file = open(path, "w", buffering=1 << 20)
+        self.file.write(CSV_HEADER)
+        self.lines = []
+
+    def write(self, rule):
+        (antecedent, consequent, confidence, lift, support) = rule
+        self.lines.append("{} -> {},{:.4f},{:.4f},{:.4f}\n".format(
+            set_to_string(antecedent, self.vocabulary),
+            set_to_string(consequent, self.vocabulary),
+            confidence,
+            lift,
+            support))
+        if len(self.lines) >= CSV_WRITE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.file.write("".join(self.lines))
+        self.lines = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BinaryRuleWriter:
+    # Writes rules in a columnar NumPy .npz file; the antecedents' and
+    # consequents' item ids concatenated in int32 arrays with offsets
+    # delimiting each rule's items, and the confidence, lift and support in
+    # float32 arrays. Columns are accumulated in compact arrays as rules are
+    # passed in, and written out as a block of arrays named with the block
+    # number, e.g. "confidence_0", every BINARY_WRITE_BLOCK_SIZE rules.
+    #
+    # Item ids are numbered by the writer in the order items are first
+    # written, and their names are appended to a separate vocabulary file as
+    # each block is written, one per line, the line number being the item
+    # id. Rules whose items are ids are named by vocabulary.
+    def __init__(self, path, vocabulary=None, compress=False):
+        self.vocabulary = vocabulary
+        self.file = zipfile.ZipFile(
+            path,
+            "w",
+            zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+            allowZip64=True)
+        self.vocabulary_file = open(vocabulary_path(path), "w")
+        self.ids = dict()
+        self.names = []
+        self.num_blocks = 0
+        self.clear()
+
+    def clear(self):
+        self.antecedent_offsets = array('q', [0])
+        self.antecedent_items = array('i')
+        self.consequent_offsets = array('q', [0])
+        self.consequent_items = array('i')
+        self.metrics = array('f')
+
+    def item_id(self, item):
+        item_id = self.ids.get(item)
+        if item_id is None:
+            item_id = len(self.ids)
+            self.ids[item] = item_id
+            if isinstance(item, int):
+                self.names.append(self.vocabulary.name_of(item))
+            else:
+                self.names.append(str(item))
+        return item_id
+
+    def write(self, rule):
+        (antecedent, consequent, confidence, lift, support) = rule
+        self.antecedent_items.extend(map(self.item_id, antecedent))
+        self.antecedent_offsets.append(len(self.antecedent_items))
+        self.consequent_items.extend(map(self.item_id, consequent))
+        self.consequent_offsets.append(len(self.consequent_items))
+        self.metrics.extend((confidence, lift, support))
+        if len(self.antecedent_offsets) > BINARY_WRITE_BLOCK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if len(self.antecedent_offsets) == 1:
+            return
+        metrics = numpy.frombuffer(self.metrics, dtype=numpy.float32)
+        metrics = metrics.reshape(-1, 3)
+        columns = {
+            "antecedent_offsets": numpy.frombuffer(
+                self.antecedent_offsets, dtype=numpy.int64),
+            "antecedent_items": numpy.frombuffer(
+                self.antecedent_items, dtype=numpy.int32),
+            "consequent_offsets": numpy.frombuffer(
+                self.consequent_offsets, dtype=numpy.int64),
+            "consequent_items": numpy.frombuffer(
+                self.consequent_items, dtype=numpy.int32),
+            "confidence": metrics[:, 0],
+            "lift": metrics[:, 1],
+            "support": metrics[:, 2],
+        }
+        for (name, column) in columns.items():
+            member = "{}_{}.npy".format(name, self.num_blocks)
+            with self.file.open(member, "w", force_zip64=True) as output:
+                numpy.lib.format.write_array(output, column)
+        self.num_blocks += 1
+        for name in self.names:
+            self.vocabulary_file.write(name + "\n")
+        self.names = []
+        self.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.vocabulary_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+RULE_WRITERS = {
+    CsvRuleFormat: CsvRuleWriter,
+    BinaryRuleFormat: BinaryRuleWriter,
+}
+
+
+def make_rule_writer(path, rule_format, vocabulary=None, compress=False):
+    if rule_format not in RULE_WRITERS:
+        raise ValueError("Unknown rule format {}".format(rule_format))
+    return RULE_WRITERS[rule_format](path, vocabulary, compress)
+
+
+def read_rules(path, vocabulary=None):
+    # Yields (antecedent, consequent, confidence, lift, support) rules from a
+    # file written by either writer, compressed or not. Items are returned
+    # as ids interned in vocabulary if passed, else as Items.
+    if vocabulary is not None:
+        def make_item(name):
+            return vocabulary.intern(name)
+    else:
+        make_item = Item
+    with open(path, "rb") as input_file:
+        magic = input_file.read(2)
+    if magic == ZIP_MAGIC:
+        return read_binary_rules(path, make_item)
+    return read_csv_rules(path, make_item, magic == GZIP_MAGIC)
+
+
+def read_csv_rules(path, make_item, compressed):
+    opener = gzip.open if compressed else open
+    with opener(path, "rt") as input_file:
+        if input_file.readline() != CSV_HEADER:
+            raise ValueError("{} is not a rules file".format(path))
+        for line in input_file:
+            (rule, confidence, lift, support) = line.rstrip("\n").rsplit(
+                ",", 3)
+            (antecedent, consequent) = rule.split(" -> ")
+            yield (frozenset(map(make_item, antecedent.split(" "))),
+                   frozenset(map(make_item, consequent.split(" "))),
+                   float(confidence),
+                   float(lift),
+                   float(support))
+
+
+def read_binary_rules(path, make_item):
+    with open(vocabulary_path(path)) as vocabulary_file:
+        items = [make_item(name.rstrip("\n")) for name in vocabulary_file]
+    with numpy.load(path) as columns:
+        block = 0
+        while "confidence_{}".format(block) in columns:
+            yield from read_binary_block(columns, block, items)
+            block += 1
+
+
+def read_binary_block(columns, block, items):
+    def column(name):
+        return columns["{}_{}".format(name, block)].tolist()
+    antecedent_offsets = column("antecedent_offsets")
+    antecedent_items = column("antecedent_items")
+    consequent_offsets = column("consequent_offsets")
+    consequent_items = column("consequent_items")
+    confidence = column("confidence")
+    lift = column("lift")
+    support = column("support")
+    for i in range(len(confidence)):
+        antecedent = antecedent_items[
+            antecedent_offsets[i]:antecedent_offsets[i + 1]]
+        consequent = consequent_items[
+            consequent_offsets[i]:consequent_offsets[i + 1]]
+        yield (frozenset(items[j] for j in antecedent),
+               frozenset(items[j] for j in consequent),
+               confidence[i],
+               lift[i],
+               support[i])
+
+
+def load_rule_tree(path, vocabulary=None, window_size=None):
+    # Returns a RuleTree of the rules in a file written by either writer.
+    tree = RuleTree(window_size)
+    for (antecedent, consequent, _, _, _) in read_rules(path, vocabulary):
+        tree.insert(antecedent, consequent)
+    return tree
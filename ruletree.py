@@ -1,6 +1,10 @@
-from item import Item
-from collections import Counter
-from collections import deque
+from item import is_item
+import copy
+from scipy.sparse import csr_matrix
+from transactionstore import TransactionStore
+import numpy
+
+ROOT = 0
 
 
 class RuleTreeNode:
@@ -22,18 +26,6 @@ class RuleTreeNode:
             self.antecedent_children) == 0 and len(
             self.consequent_children) == 0
 
-    def matches(self, itemset, path):
-        if len(itemset) == 0:
-            return
-        for index in range(len(itemset)):
-            item = itemset[index]
-            if item in self.antecedent_children:
-                for match in self.antecedent_children[item].matches(
-                        itemset[index + 1:], path + [item]):
-                    yield match
-            if item in self.consequent_children:
-                yield (tuple(path), item)
-
     def rules(self, antecedent_path):
         result = set()
         for consequent in self.consequent_children:
@@ -43,69 +35,403 @@ class RuleTreeNode:
         return result
 
 
+class RuleMatcher:
+    # The rules of a RuleTree compiled into flat tables for matching
+    # transactions against. Items are mapped to dense integer indexes, and
+    # the antecedent trie is flattened into per-node lists indexed by node
+    # number; children maps an item index to the child node's number, and
+    # consequents holds the (item index, rule id) pairs of the rules ending
+    # at the node. Rule ids index into keys, the (antecedent, consequent)
+    # pairs of the rules in insertion order, and order is the permutation
+    # which sorts the rule ids by key.
+    #
+    # For matching blocks of transactions at once, rule_items is the sparse
+    # item by rule incidence matrix of the rules' items; their antecedent
+    # items and consequent, and rule_sizes is the number of items in each
+    # rule.
+    def __init__(self, root, keys, rule_id):
+        self.item_index = dict()
+        self.children = [dict()]
+        self.consequents = [[]]
+        stack = [(root, [], ROOT)]
+        while len(stack) > 0:
+            (node, path, number) = stack.pop()
+            for consequent in node.consequent_children:
+                self.consequents[number].append(
+                    (self.index_of(consequent),
+                     rule_id[(tuple(path), consequent)]))
+            for (item, child) in node.antecedent_children.items():
+                child_number = len(self.children)
+                self.children.append(dict())
+                self.consequents.append([])
+                self.children[number][self.index_of(item)] = child_number
+                stack.append((child, path + [item], child_number))
+        self.order = numpy.array(
+            sorted(range(len(keys)), key=keys.__getitem__), dtype=numpy.intp)
+        items = []
+        rules = []
+        for (rule, (antecedent, consequent)) in enumerate(keys):
+            items.extend(map(self.item_index.__getitem__, antecedent))
+            items.append(self.item_index[consequent])
+            rules.extend([rule] * (len(antecedent) + 1))
+        self.rule_items = csr_matrix(
+            (numpy.ones(len(items), dtype=numpy.int32), (items, rules)),
+            shape=(len(self.item_index), len(keys)))
+        self.rule_sizes = numpy.diff(self.rule_items.tocsc().indptr)
+        # Maps item ids to item indexes when matching TransactionStores;
+        # grown to cover the largest item id seen.
+        self.id_index = self.make_id_index(0)
+
+    def index_of(self, item):
+        index = self.item_index.get(item)
+        if index is None:
+            index = len(self.item_index)
+            self.item_index[item] = index
+        return index
+
+    def match(self, transaction):
+        # Returns the list of ids of the rules which transaction matches.
+        # Items which aren't in any rule are dropped up front. A rule's
+        # antecedent items are all in the transaction iff each node on the
+        # path to it is reached, regardless of their order in the
+        # transaction, so the transaction need not be sorted.
+        item_index = self.item_index
+        items = set()
+        for item in transaction:
+            index = item_index.get(item)
+            if index is not None:
+                items.add(index)
+        matched = []
+        stack = [ROOT]
+        while len(stack) > 0:
+            node = stack.pop()
+            for (consequent, rule) in self.consequents[node]:
+                if consequent in items:
+                    matched.append(rule)
+            children = self.children[node]
+            # Walk whichever of the node's children or the transaction's
+            # items is smaller.
+            if len(children) <= len(items):
+                for (item, child) in children.items():
+                    if item in items:
+                        stack.append(child)
+            else:
+                for item in items:
+                    child = children.get(item)
+                    if child is not None:
+                        stack.append(child)
+        return matched
+
+    def match_batch(self, transactions):
+        # Returns (matched, offsets), the ids of the rules each transaction
+        # in transactions matches, concatenated, and offsets such that
+        # transaction i's matches are matched[offsets[i]:offsets[i + 1]].
+        # Multiplying the transaction by item incidence matrix by the item by
+        # rule incidence matrix gives, for each transaction and rule, the
+        # number of the rule's items in the transaction; the transaction
+        # matches the rule iff that's all of them.
+        if isinstance(transactions, TransactionStore):
+            incidence = self.store_incidence(transactions)
+        else:
+            incidence = self.incidence(transactions)
+        overlap = incidence @ self.rule_items
+        hit = overlap.data == self.rule_sizes[overlap.indices]
+        rows = numpy.repeat(numpy.arange(overlap.shape[0]),
+                            numpy.diff(overlap.indptr))
+        offsets = numpy.zeros(overlap.shape[0] + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(rows[hit], minlength=overlap.shape[0]),
+                     out=offsets[1:])
+        return (overlap.indices[hit], offsets)
+
+    def incidence(self, transactions):
+        # Returns the sparse transaction by item incidence matrix of
+        # transactions, over the items in the rules.
+        item_index = self.item_index
+        items = []
+        indptr = [0]
+        for transaction in transactions:
+            indexes = set()
+            for item in transaction:
+                index = item_index.get(item)
+                if index is not None:
+                    indexes.add(index)
+            items.extend(indexes)
+            indptr.append(len(items))
+        return csr_matrix(
+            (numpy.ones(len(items), dtype=numpy.int32), items, indptr),
+            shape=(len(indptr) - 1, len(item_index)))
+
+    def store_incidence(self, store):
+        # As incidence(), for a TransactionStore, whose items are already in
+        # compressed sparse row form; its item ids are mapped to our item
+        # indexes all at once, with no per transaction work. A
+        # transaction's item ids are distinct, so its indexes are too.
+        if len(store.items) > 0 and store.items.max() >= len(self.id_index):
+            self.id_index = self.make_id_index(int(store.items.max()) + 1)
+        indexes = self.id_index[store.items]
+        keep = indexes >= 0
+        rows = numpy.repeat(numpy.arange(len(store)), numpy.diff(store.offsets))
+        return csr_matrix(
+            (numpy.ones(int(numpy.count_nonzero(keep)), dtype=numpy.int32),
+             (rows[keep], indexes[keep])),
+            shape=(len(store), len(self.item_index)))
+
+    def make_id_index(self, size):
+        # Returns the array mapping each item id less than size to its item
+        # index, or -1 for ids which aren't in any rule.
+        id_index = numpy.full(size, -1, dtype=numpy.intp)
+        for (item, index) in self.item_index.items():
+            if isinstance(item, int) and item < size:
+                id_index[item] = index
+        return id_index
+
+
+def ring_take(buffer, start, count):
+    # Returns a copy of count elements of the ring buffer, from start on.
+    return buffer[(start + numpy.arange(count)) % len(buffer)]
+
+
+def ring_put(buffer, start, values):
+    # Overwrites len(values) elements of the ring buffer, from start on.
+    buffer[(start + numpy.arange(len(values))) % len(buffer)] = values
+
+
+class MatchWindow:
+    # The ids of the rules which each of the last size transactions matched,
+    # so that when a transaction drops out of the window its matches can be
+    # removed without matching it again. The ids are kept in one ring
+    # buffer, oldest transaction's first, and the number each transaction
+    # matched in a ring buffer of size slots; both are overwritten in place
+    # as transactions are added and evicted. The ids' buffer only grows,
+    # doubling, when the window's transactions match more rules than it
+    # holds.
+    def __init__(self, size):
+        assert(size > 0)
+        self.lengths = numpy.zeros(size, dtype=numpy.int64)
+        self.start = 0
+        self.length = 0
+        self.ids = numpy.zeros(size, dtype=numpy.int32)
+        self.ids_start = 0
+        self.num_ids = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, matched):
+        # Adds the rule ids matched by the newest transaction. If the window
+        # was full, returns those of the oldest transaction, which it
+        # replaces, else returns None.
+        (evicted, lengths) = self.extend(matched, [0, len(matched)])
+        return evicted if len(lengths) > 0 else None
+
+    def extend(self, matched, offsets):
+        # Adds the rule ids matched by a batch of transactions, transaction i
+        # having matched matched[offsets[i]:offsets[i + 1]]. Returns
+        # (ids, lengths) for the oldest transactions evicted to make room;
+        # the ids they matched concatenated, and the number each matched.
+        size = len(self.lengths)
+        matched = matched[offsets[0]:offsets[-1]]
+        lengths = numpy.diff(offsets)
+        num_evicted = max(0, self.length + len(lengths) - size)
+        oldest = min(num_evicted, self.length)
+        evicted_lengths = ring_take(self.lengths, self.start, oldest)
+        count = int(evicted_lengths.sum())
+        evicted = ring_take(self.ids, self.ids_start, count)
+        self.start = (self.start + oldest) % size
+        self.length -= oldest
+        self.ids_start = (self.ids_start + count) % len(self.ids)
+        self.num_ids -= count
+        if num_evicted > oldest:
+            # The batch is larger than the window, so its first
+            # transactions are evicted as soon as they're added.
+            skip = num_evicted - oldest
+            count = int(lengths[:skip].sum())
+            evicted_lengths = numpy.concatenate(
+                (evicted_lengths, lengths[:skip]))
+            evicted = numpy.concatenate((evicted, matched[:count]))
+            lengths = lengths[skip:]
+            matched = matched[count:]
+        ring_put(self.lengths, self.start + self.length, lengths)
+        self.length += len(lengths)
+        if self.num_ids + len(matched) > len(self.ids):
+            self.grow(self.num_ids + len(matched))
+        ring_put(self.ids, self.ids_start + self.num_ids, matched)
+        self.num_ids += len(matched)
+        return (evicted, evicted_lengths)
+
+    def grow(self, capacity):
+        ids = numpy.zeros(max(capacity, 2 * len(self.ids)), dtype=numpy.int32)
+        ids[:self.num_ids] = ring_take(self.ids, self.ids_start, self.num_ids)
+        self.ids = ids
+        self.ids_start = 0
+
+    def copy(self):
+        window = copy.copy(self)
+        window.lengths = self.lengths.copy()
+        window.ids = self.ids.copy()
+        return window
+
+
 class RuleTree:
     def __init__(self, window_size=None):
         self.root = RuleTreeNode()
-        self.match_counter = Counter()
+        # (antecedent, consequent) of each rule, indexed by rule id.
+        self.rule_keys = []
+        self.rule_id = dict()
+        self.match_counts = numpy.zeros(0, dtype=numpy.int64)
+        # Which rules' match counts have changed since the last call to
+        # take_changed_rules(), and a buffer for the rules' supports, both
+        # indexed by rule id.
+        self.changed_rules = numpy.zeros(0, dtype=bool)
+        self.supports = numpy.zeros(0)
+        # Compiled from the rules on the first call to record_matches()
+        # after they've changed.
+        self.matcher = None
+        # Set once the rules are shared with a copy of the tree, after which
+        # no more rules may be inserted.
+        self.shared_rules = False
         self.rag_bag_count = 0
         self.transaction_count = 0
         self.window_size = window_size
-        self.window = deque()
+        # Ids of the rules matched by each transaction in the window.
+        self.window = None
+        if window_size is not None:
+            self.window = MatchWindow(window_size)
 
     def insert(self, antecedent, consequent):
+        assert(not self.shared_rules)
         if len(antecedent) == 0:
             raise TypeError("antecedent should be non-empty")
         if len(consequent) != 1:
             raise TypeError("consequent set should contain only 1 Item")
         consequent = list(consequent)[0]
-        if not isinstance(consequent, Item):
+        if not is_item(consequent):
             raise TypeError("consequent should be an Item")
         antecedent = list(antecedent)
-        if not all(map(lambda i: isinstance(i, Item), antecedent)):
+        if not all(map(is_item, antecedent)):
             raise TypeError("antecedent should contain Items")
         antecedent.sort()
         self.root.insert(antecedent, consequent)
-        self.match_counter[(tuple(antecedent), consequent)] = 0
+        key = (tuple(antecedent), consequent)
+        if key not in self.rule_id:
+            self.rule_id[key] = len(self.rule_keys)
+            self.rule_keys.append(key)
+            self.matcher = None
+
+    def compiled_matcher(self):
+        if self.matcher is None:
+            self.matcher = RuleMatcher(self.root, self.rule_keys, self.rule_id)
+            # Rules inserted since the last compile start with no matches.
+            new_rules = len(self.rule_keys) - len(self.match_counts)
+            self.match_counts = numpy.concatenate(
+                (self.match_counts, numpy.zeros(new_rules, dtype=numpy.int64)))
+            self.changed_rules = numpy.concatenate(
+                (self.changed_rules, numpy.ones(new_rules, dtype=bool)))
+            self.supports = numpy.zeros(len(self.rule_keys))
+        return self.matcher
+
+    def copy(self, with_counts=True):
+        # Returns a tree of the same rules, which shares this tree's rule trie
+        # and compiled matcher rather than copying them. The copy has its own
+        # match counts and window; copies of this tree's if with_counts, else
+        # empty ones.
+        self.compiled_matcher()
+        self.shared_rules = True
+        tree = copy.copy(self)
+        if with_counts:
+            tree.match_counts = self.match_counts.copy()
+            tree.changed_rules = self.changed_rules.copy()
+            if self.window is not None:
+                tree.window = self.window.copy()
+        else:
+            tree.match_counts = numpy.zeros_like(self.match_counts)
+            tree.changed_rules = numpy.ones_like(self.changed_rules)
+            if self.window is not None:
+                tree.window = MatchWindow(self.window_size)
+            tree.rag_bag_count = 0
+            tree.transaction_count = 0
+        tree.supports = numpy.zeros_like(self.supports)
+        return tree
 
     def record_matches(self, itemset):
-        itemset = list(itemset)
-        if not all(map(lambda i: isinstance(i, Item), itemset)):
-            raise TypeError("itemset should contain Items")
-        itemset.sort()
-        found_match = False
-        for (antecedent, consequent) in self.root.matches(itemset, []):
-            self.match_counter[antecedent, consequent] += 1
-            found_match = True
-        if not found_match:
+        matched = self.compiled_matcher().match(itemset)
+        if len(matched) > 0:
+            self.match_counts[matched] += 1
+            self.changed_rules[matched] = True
+        else:
             self.rag_bag_count += 1
         self.transaction_count += 1
-        if self.window_size is not None:
-            self.window.append(itemset)
-            if len(self.window) > self.window_size:
-                itemset = self.window.popleft()
-                self.remove_matches(itemset)
+        if self.window is not None:
+            evicted = self.window.append(
+                numpy.array(matched, dtype=numpy.int32))
+            if evicted is not None:
+                self.remove_matched(evicted)
+            assert(self.transaction_count == len(self.window))
+
+    def record_matches_batch(self, transactions):
+        # Equivalent to calling record_matches() on each of transactions in
+        # turn, but matches them all at once, and updates the counts once.
+        if not isinstance(transactions, TransactionStore):
+            transactions = list(transactions)
+        if len(transactions) == 0:
+            return
+        (matched, offsets) = self.compiled_matcher().match_batch(transactions)
+        self.match_counts += numpy.bincount(
+            matched, minlength=len(self.match_counts))
+        self.changed_rules[matched] = True
+        self.rag_bag_count += int(numpy.count_nonzero(
+            offsets[1:] == offsets[:-1]))
+        self.transaction_count += len(transactions)
+        if self.window is not None:
+            (evicted, lengths) = self.window.extend(matched, offsets)
+            if len(lengths) > 0:
+                self.remove_matched_batch(evicted, lengths)
             assert(self.transaction_count == len(self.window))
 
     def remove_matches(self, itemset):
-        if not all(map(lambda i: isinstance(i, Item), itemset)):
-            raise TypeError("itemset should contain Items")
-        found_match = False
-        for (antecedent, consequent) in self.root.matches(itemset, []):
-            self.match_counter[(antecedent, consequent)] -= 1
-            found_match = True
-        if not found_match:
+        self.remove_matched(self.compiled_matcher().match(itemset))
+
+    def remove_matched(self, matched):
+        if len(matched) > 0:
+            self.match_counts[matched] -= 1
+            self.changed_rules[matched] = True
+        else:
             self.rag_bag_count -= 1
         self.transaction_count -= 1
 
+    def remove_matched_batch(self, matched, lengths):
+        # matched is the rule ids matched by the transactions to remove,
+        # concatenated, and lengths the number each matched.
+        matched_rules = matched.astype(numpy.intp)
+        self.match_counts -= numpy.bincount(
+            matched_rules, minlength=len(self.match_counts))
+        self.changed_rules[matched_rules] = True
+        self.rag_bag_count -= int(numpy.count_nonzero(lengths == 0))
+        self.transaction_count -= len(lengths)
+
     def rag_bag(self):
         return self.rag_bag_count / self.transaction_count
 
-    # Returns vector of rule supports.
+    # Returns vector of rule supports, ordered by (antecedent, consequent).
     def match_vector(self):
-        return list(map(lambda i: i / self.transaction_count,
-                        map(lambda i: i[1],
-                            sorted(self.match_counter.items(),
-                                   key=lambda i: i[0]))))
+        order = self.compiled_matcher().order
+        return self.support_vector()[order].tolist()
+
+    def support_vector(self):
+        # Returns the rules' supports indexed by rule id. This is a buffer
+        # which is overwritten by the next call.
+        self.compiled_matcher()
+        return numpy.divide(self.match_counts,
+                            self.transaction_count,
+                            out=self.supports)
+
+    def take_changed_rules(self):
+        # Returns the ids of the rules whose match counts have changed since
+        # the last call.
+        self.compiled_matcher()
+        changed = numpy.flatnonzero(self.changed_rules)
+        self.changed_rules[changed] = False
+        return changed
 
     def rule_miss_rate(self):
         # Can only take match counts if we're not using a sliding window.
@@ -116,14 +442,20 @@ class RuleTree:
     def clear_rule_match_counts(self):
         # Can only take match counts if we're not using a sliding window.
         assert(self.window_size is None)
-        self.match_counter.clear()
+        self.match_counts[:] = 0
+        self.changed_rules[:] = True
         self.transaction_count = 0
         self.rag_bag_count = 0
 
     def take_and_add_matches(self, other):
         # Can only take match counts if we're not using a sliding window.
         assert(self.window_size is None)
-        self.match_counter.update(other.match_counter)
+        # Both trees must have the same rules, with the same ids.
+        self.compiled_matcher()
+        other.compiled_matcher()
+        assert(len(self.rule_keys) == len(other.rule_keys))
+        self.match_counts += other.match_counts
+        self.changed_rules |= other.match_counts != 0
         self.transaction_count += other.transaction_count
         self.rag_bag_count += other.rag_bag_count
         other.clear_rule_match_counts()
@@ -137,9 +469,12 @@ class RuleTree:
     def match_count_of(self, antecedent, consequent):
         if not isinstance(antecedent, tuple):
             raise TypeError("antecedent should be a Tuple of Items")
-        if not isinstance(consequent, Item):
+        if not is_item(consequent):
             raise TypeError("consequent should be an Item")
-        return self.match_counter[(antecedent, consequent)]
+        rule = self.rule_id.get((antecedent, consequent))
+        if rule is None or rule >= len(self.match_counts):
+            return 0
+        return int(self.match_counts[rule])
 
     def rules(self):
         # Returns a set of (antecedent,consequent) pairs of rules in the tree.
@@ -1,4 +1,3 @@
-from copy import deepcopy
 from driftdetector import SAMPLE_INTERVAL
 from driftdetector import Drift
 from hoeffdingbound import hoeffding_bound
@@ -21,12 +20,9 @@ class SeedDriftDetector:
         self.volatility_detector = volatility_detector
 
     def make_test_tree(self):
-        # Copy the training rule tree, so that we get a copy of the rules.
-        tree = deepcopy(self.training_rule_tree)
-        # Clear the rule match counts so that we can re-generate them
-        # as we read in more data.
-        tree.clear_rule_match_counts()
-        return tree
+        # Share the training rule tree's rules, with cleared rule match
+        # counts so that we can re-generate them as we read in more data.
+        return self.training_rule_tree.copy(with_counts=False)
 
     def train(self, window, rules):
         self.training_rule_tree = RuleTree()
@@ -35,8 +31,7 @@ class SeedDriftDetector:
 
         # Populate the training rule tree with the rule frequencies from
         # the training window.
-        for transaction in window:
-            self.training_rule_tree.record_matches(transaction)
+        self.training_rule_tree.record_matches_batch(window)
 
         self.previous_rule_tree = self.make_test_tree()
         self.current_rule_tree = self.make_test_tree()
@@ -45,7 +40,9 @@ class SeedDriftDetector:
         # training window.
         self.training_mean, self.training_len = self.training_rule_tree.rule_miss_rate()
 
-        self.num_test_transactions = 0
+        # Transactions read since the last test, which are matched against
+        # the rules as a block when the next test is made.
+        self.test_transactions = []
 
     def should_merge(self, transaction_num):
         if self.volatility_detector is not None:
@@ -67,13 +64,19 @@ class SeedDriftDetector:
 
     def check_for_drift(self, transaction, transaction_num):
         # Append to current block.
-        self.current_rule_tree.record_matches(transaction)
-
-        self.num_test_transactions += 1
-        if self.num_test_transactions < SAMPLE_INTERVAL:
+        self.test_transactions.append(transaction)
+        if len(self.test_transactions) < SAMPLE_INTERVAL:
             return None
-        # Test for drift.
-        self.num_test_transactions = 0
+        block = self.test_transactions
+        self.test_transactions = []
+        return self.check_block(block, transaction_num)
+
+    def check_block(self, block, transaction_num):
+        # Tests for drift after the SAMPLE_INTERVAL transactions in block,
+        # as DriftDetector.check_block() does.
+        assert(len(block) == SAMPLE_INTERVAL)
+        assert(len(self.test_transactions) == 0)
+        self.current_rule_tree.record_matches_batch(block)
 
         if self.previous_rule_tree.transaction_count == 0:
             # First block, can't merge/drop.
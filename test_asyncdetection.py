@@ -0,0 +1,58 @@
+import asyncio
+import shutil
+from asyncdetection import detect, queue_transactions, stream_transactions
+from virtualchangedetection import detect_drifts, make_arg_parser, quiet
+
+
+def test_detect_from_streams(tmp_path):
+    # The input is copied so that its transaction cache is written there.
+    shutil.copy("datasets/mushroom.csv", tmp_path)
+    args = make_arg_parser("test").parse_args([
+        "--input", str(tmp_path / "mushroom.csv"),
+        "--output", "rules.csv",
+        "--min-confidence", "0.95",
+        "--min-support", "0.9",
+        "--min-lift", "1.0",
+        "--training-window-size", "500",
+        "--drift-algorithm", "prochange",
+        "--disable-save-rules",
+    ])
+    expected = [(transaction_num, drift.drift_type)
+                for (transaction_num, drift) in detect_drifts(args, quiet)]
+    assert(len(expected) > 0)
+    with open(args.input) as input_file:
+        lines = input_file.readlines()
+
+    async def from_queue():
+        # A small queue, so the producer has to wait for detection.
+        queue = asyncio.Queue(maxsize=10)
+
+        async def produce():
+            for line in lines:
+                await queue.put(line.strip().split(","))
+            await queue.put(None)
+        producer = asyncio.ensure_future(produce())
+        drifts = [(transaction_num, drift.drift_type)
+                  async for (transaction_num, drift)
+                  in detect(queue_transactions(queue), args, log=quiet,
+                            max_buffered=100)]
+        await producer
+        return drifts
+
+    async def from_reader():
+        reader = asyncio.StreamReader()
+        reader.feed_data("".join(lines).encode())
+        reader.feed_eof()
+        return [(transaction_num, drift.drift_type)
+                async for (transaction_num, drift)
+                in detect(stream_transactions(reader), args, log=quiet)]
+
+    assert(asyncio.run(from_queue()) == expected)
+    assert(asyncio.run(from_reader()) == expected)
+
+    # In incremental mining mode, the windows mined after drifts end at them.
+    args.incremental_mining = True
+    expected = [(transaction_num, drift.drift_type)
+                for (transaction_num, drift) in detect_drifts(args, quiet)]
+    assert(len(expected) > 0)
+    assert(asyncio.run(from_reader()) == expected)
@@ -0,0 +1,26 @@
+import numpy
+from driftdetector import HellingerDistance, hellinger
+from item import ItemSet
+from ruletree import RuleTree
+
+
+def test_incremental_hellinger_distance():
+    rules = [
+        ("abc", "d"),
+        ("abc", "f"),
+        ("ac", "g"),
+        ("bc", "d"),
+        ("de", "g"),
+    ]
+    transactions = ["abcd", "geabcd", "abc", "bcd", "def", "geab", "xy",
+                    "acg", "bcdf", "abcfg", "deg", "abcdefg"]
+    transactions = list(map(ItemSet, transactions))
+    tree = RuleTree(4)
+    for (antecedent, consequent) in rules:
+        tree.insert(ItemSet(antecedent), ItemSet(consequent))
+    p = numpy.array([0.1, 0.2, 0.3, 0.25, 0.15])
+    distance = HellingerDistance(p, tree)
+    for start in range(0, len(transactions), 2):
+        tree.record_matches_batch(transactions[start:start + 2])
+        expected = hellinger(p, tree.support_vector())
+        assert(abs(distance.distance() - expected) < 1e-12)
@@ -0,0 +1,39 @@
+from datasetreader import DatasetReader
+from eclat import mine_eclat
+from fptree import mine_fp_tree
+from item import Item, ItemSet
+
+
+def test_eclat():
+    # Eclat and dEclat must mine the same itemsets with the same counts as
+    # FP-Growth.
+    datasets = [
+        (list(DatasetReader("datasets/UCI-zoo.csv")), 0.3),
+        (list(DatasetReader("datasets/mushroom.csv")), 0.4),
+    ]
+    for (transactions, min_support) in datasets:
+        for max_length in [None, 2]:
+            (expected_itemsets, expected_counts, expected_num) = mine_fp_tree(
+                transactions, min_support, max_length=max_length)
+            for diffsets in [False, True]:
+                (itemsets, itemset_counts, num_transactions) = mine_eclat(
+                    transactions, min_support, False, max_length, diffsets)
+                assert(itemsets == expected_itemsets)
+                assert(itemset_counts == expected_counts)
+                assert(num_transactions == expected_num)
+
+
+def test_eclat_maximal():
+    transactions = [list(map(Item, t))
+                    for t in ["abc", "abc", "abd", "bd", "cd", "e"]]
+    (itemsets, itemset_counts, _) = mine_eclat(transactions, 2 / 6)
+    for diffsets in [False, True]:
+        (maximal, _, _) = mine_eclat(transactions, 2 / 6, True, None, diffsets)
+        assert(maximal <= itemsets)
+        # Every itemset with no frequent superset is a leaf of the search.
+        for itemset in itemsets:
+            if not any(itemset < other for other in itemsets):
+                assert(itemset in maximal)
+    assert(itemset_counts[ItemSet("abc")] == 2)
+    assert(itemset_counts[ItemSet("bd")] == 2)
+    assert(ItemSet("e") not in itemsets)
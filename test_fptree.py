@@ -1,18 +1,30 @@
 from collections import Counter
 from fptree import FPTree
 from fptree import mine_fp_tree
+from fptree import mine_fp_tree_iter
+from incrementalfptree import IncrementalFPGrowth
+from generaterules import generate_rules
+from generaterules import generate_rules_from_stream
 from fptree import construct_initial_tree
 from fptree import count_item_frequency_in
 from fptree import sort_transaction
+from fptree import ArrayTreeEngine
+from fptree import NodeTreeEngine
 from apriori import apriori
 from index import InvertedIndex
 from item import Item
 from item import ItemSet
+from item import Vocabulary
 from datasetreader import DatasetReader
+import random
 import time
 import sys
 
 
+def ItemList(s):
+    return list(map(Item, s))
+
+
 test_transactions = list(map(lambda t: list(map(Item, t)), [
     ["a", "b"],
     ["b", "c", "d"],
@@ -149,3 +161,196 @@ def test_tree_iter():
     for (transaction, count) in tree:
         observed[frozenset(transaction)] += count
     assert(expected == observed)
+
+
+def test_vocabulary_transactions():
+    # Mining interned item ids must find the same itemsets as mining Items.
+    vocabulary = Vocabulary()
+    transactions = [vocabulary.encode(map(str, t)) for t in test_transactions]
+    (itemsets, itemset_counts, _) = mine_fp_tree(
+        transactions, 2 / len(transactions))
+    (expected_itemsets, expected_counts, _) = mine_fp_tree(
+        test_transactions, 2 / len(test_transactions))
+    decoded = {ItemSet(vocabulary.decode(i)): itemset_counts[i]
+               for i in itemsets}
+    assert(decoded == {i: expected_counts[i] for i in expected_itemsets})
+
+    for (ids, items) in zip(DatasetReader("datasets/UCI-zoo.csv", vocabulary),
+                            DatasetReader("datasets/UCI-zoo.csv")):
+        assert(list(ids) == sorted(ids))
+        assert(ItemSet(vocabulary.decode(ids)) == frozenset(items))
+
+
+def test_array_tree_engine():
+    # The array backed FP-tree must mine the same itemsets with the same
+    # counts as the FPNode tree.
+    datasets = [
+        (test_transactions, 2 / len(test_transactions)),
+        (list(DatasetReader("datasets/UCI-zoo.csv")), 0.3),
+        (list(DatasetReader("datasets/mushroom.csv")), 0.4),
+    ]
+    for (transactions, min_support) in datasets:
+        for maximal in [False, True]:
+            (expected_itemsets, expected_counts, expected_num) = mine_fp_tree(
+                transactions, min_support, maximal)
+            (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+                transactions, min_support, maximal, ArrayTreeEngine)
+            assert(itemsets == expected_itemsets)
+            assert(itemset_counts == expected_counts)
+            assert(num_transactions == expected_num)
+
+
+def test_construct_from_iterator():
+    # The initial tree is built in one pass, so mining a one-shot iterator
+    # must give the same result as mining a list.
+    for engine in [NodeTreeEngine, ArrayTreeEngine]:
+        expected = mine_fp_tree(
+            list(DatasetReader("datasets/UCI-zoo.csv")), 0.3, False, engine)
+        observed = mine_fp_tree(
+            iter(DatasetReader("datasets/UCI-zoo.csv")), 0.3, False, engine)
+        assert(expected == observed)
+
+
+def test_sparse_initial_tree():
+    # Sparse transactions share few prefixes, so most of them are distinct
+    # paths. Building the initial tree must still be about as fast as two
+    # passes inserting each transaction in frequency order.
+    rng = random.Random(1)
+    items = list(map(Item, map(str, range(1000))))
+    transactions = [rng.sample(items, rng.randint(5, 15))
+                    for _ in range(20000)]
+    min_support = 0.01
+
+    start = time.time()
+    (item_count, num_transactions) = count_item_frequency_in(transactions)
+    min_count = num_transactions * min_support
+    expected = FPTree()
+    for transaction in transactions:
+        expected.insert(sort_transaction(
+            [item for item in transaction if item_count[item] >= min_count],
+            item_count))
+    two_pass_duration = time.time() - start
+
+    start = time.time()
+    (tree, observed_num_transactions) = construct_initial_tree(
+        transactions, min_support)
+    duration = time.time() - start
+    print("Built the tree in {:.2f} seconds, two passes took {:.2f}".format(
+        duration, two_pass_duration))
+    assert(observed_num_transactions == num_transactions)
+    assert(tree.item_count == expected.item_count)
+    assert(duration < 2 * two_pass_duration + 0.1)
+
+    (tree, _) = construct_initial_tree(
+        transactions, min_support, ArrayTreeEngine)
+    assert(tree.item_count == expected.item_count)
+
+
+def test_single_path_tree():
+    # Transactions which form a single path in the tree are mined without
+    # recursing; every combination of the path's frequent items is frequent.
+    transactions = [ItemList("abcd")] * 3 + [ItemList("abc")] + [ItemList("a")]
+    for engine in [NodeTreeEngine, ArrayTreeEngine]:
+        (itemsets, itemset_counts, _) = mine_fp_tree(
+            transactions, 4 / 5, False, engine)
+        assert(itemsets == {ItemSet("a"), ItemSet("b"), ItemSet("c"),
+                            ItemSet("ab"), ItemSet("ac"), ItemSet("bc"),
+                            ItemSet("abc")})
+        assert(itemset_counts[ItemSet("a")] == 5)
+        assert(itemset_counts[ItemSet("bc")] == 4)
+        (maximal, _, _) = mine_fp_tree(transactions, 3 / 5, True, engine)
+        assert(maximal == {ItemSet("a"), ItemSet("ab"), ItemSet("ac"),
+                           ItemSet("ad"), ItemSet("abc"), ItemSet("abd"),
+                           ItemSet("acd"), ItemSet("abcd")})
+
+
+def test_itemset_stream():
+    transactions = list(DatasetReader("datasets/mushroom.csv"))
+    for engine in [NodeTreeEngine, ArrayTreeEngine]:
+        (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+            transactions, 0.4, False, engine)
+        (stream, _) = mine_fp_tree_iter(transactions, 0.4, False, engine)
+        seen = dict()
+        for (itemset, count) in stream:
+            # Every subset must have been yielded before the itemset.
+            for item in itemset:
+                assert(len(itemset) == 1 or itemset - {item} in seen)
+            seen[itemset] = count
+        assert(seen == itemset_counts)
+
+        (stream, _) = mine_fp_tree_iter(transactions, 0.4, False, engine)
+        rules = set(generate_rules_from_stream(
+            stream, num_transactions, 0.5, 1.0))
+        assert(rules == generate_rules(
+            itemsets, itemset_counts, num_transactions, 0.5, 1.0))
+
+        (capped, capped_counts, _) = mine_fp_tree(
+            transactions, 0.4, False, engine, 2)
+        assert(capped == {i for i in itemsets if len(i) <= 2})
+        assert(capped_counts == {i: itemset_counts[i] for i in capped})
+        (maximal, _, _) = mine_fp_tree(transactions, 0.4, True, engine, 2)
+        # Searching stops at the cap, so every itemset of the maximum length
+        # is a leaf.
+        assert({i for i in capped if len(i) == 2} <= maximal <= capped)
+
+
+def test_parallel_mining():
+    # Mining the top level conditional trees in worker processes must give
+    # the same result as mining them all in this process.
+    transactions = list(DatasetReader("datasets/mushroom.csv"))
+    for engine in [NodeTreeEngine, ArrayTreeEngine]:
+        for (maximal, max_length) in [(False, None), (True, None), (False, 3)]:
+            expected = mine_fp_tree(
+                transactions, 0.3, maximal, engine, max_length)
+            observed = mine_fp_tree(
+                transactions, 0.3, maximal, engine, max_length, workers=2)
+            assert(observed == expected)
+
+
+def test_closed_itemsets():
+    # Closed itemsets are those frequent itemsets with no superset of the
+    # same count, and they must generate the same rules as all itemsets.
+    for (csvFilePath, min_support) in [("datasets/UCI-zoo.csv", 0.4),
+                                       ("datasets/mushroom.csv", 0.3)]:
+        transactions = list(DatasetReader(csvFilePath))
+        for engine in [NodeTreeEngine, ArrayTreeEngine]:
+            (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+                transactions, min_support, False, engine)
+            (closed, closed_counts, _) = mine_fp_tree(
+                transactions, min_support, False, engine,
+                closed_itemsets_only=True)
+            by_count = dict()
+            for (itemset, count) in itemset_counts.items():
+                by_count.setdefault(count, []).append(itemset)
+            assert(closed == {i for (i, count) in itemset_counts.items()
+                              if not any(i < j for j in by_count[count])})
+            for (itemset, count) in itemset_counts.items():
+                assert(closed_counts[itemset] == count)
+            assert(generate_rules(closed,
+                                  closed_counts,
+                                  num_transactions,
+                                  0.5,
+                                  1.0) == generate_rules(itemsets,
+                                                         itemset_counts,
+                                                         num_transactions,
+                                                         0.5,
+                                                         1.0))
+
+
+def test_incremental_mining():
+    # Sliding the incremental miner's window along the dataset must find the
+    # same itemsets as mining each window from scratch.
+    transactions = list(DatasetReader("datasets/mushroom.csv"))[:2000]
+    miner = IncrementalFPGrowth(1000, 0.5)
+    for end in range(250, len(transactions) + 1, 250):
+        for transaction in transactions[end - 250:end]:
+            miner.add(transaction)
+        window = transactions[max(0, end - 1000):end]
+        (itemsets, itemset_counts, num_transactions) = miner.mine()
+        assert((itemsets, itemset_counts, num_transactions) ==
+               mine_fp_tree(window, 0.5))
+        assert(miner.mine(True) == mine_fp_tree(window, 0.5, True))
+        assert(miner.mine(True, 3) ==
+               mine_fp_tree(window, 0.5, True, max_length=3))
+    miner.expire(400)
+    assert(miner.mine() == mine_fp_tree(transactions[-600:], 0.5))
@@ -0,0 +1,42 @@
+from datasetreader import DatasetReader
+from fptree import mine_fp_tree
+from generaterules import generate_rules
+from itertools import combinations
+
+
+def test_multi_item_consequents():
+    # Compare against generating every rule from every frequent itemset, and
+    # filtering by confidence and lift.
+    transactions = list(DatasetReader("datasets/UCI-zoo.csv"))
+    (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+        transactions, 0.4)
+    (min_confidence, min_lift) = (0.8, 1.1)
+
+    def support(i):
+        return itemset_counts[i] / num_transactions
+
+    expected = set()
+    for itemset in itemsets:
+        for size in range(1, len(itemset)):
+            for consequent in map(frozenset, combinations(itemset, size)):
+                antecedent = itemset - consequent
+                confidence = support(itemset) / support(antecedent)
+                lift = confidence / support(consequent)
+                if confidence >= min_confidence and lift >= min_lift:
+                    expected.add((antecedent, consequent))
+
+    rules = generate_rules(itemsets,
+                           itemset_counts,
+                           num_transactions,
+                           min_confidence,
+                           min_lift,
+                           max_consequent_size=len(transactions[0]))
+    assert({(a, c) for (a, c, _, _, _) in rules} == expected)
+    assert(any(len(c) > 2 for (_, c, _, _, _) in rules))
+
+    single = generate_rules(itemsets,
+                            itemset_counts,
+                            num_transactions,
+                            min_confidence,
+                            min_lift)
+    assert(single == {r for r in rules if len(r[1]) == 1})
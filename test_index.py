@@ -1,5 +1,9 @@
+import csv
+import os
+import tempfile
 from index import InvertedIndex
-from item import Item
+from item import Item, ItemSet, Vocabulary
+from transactionstore import load_transactions
 
 
 def test_InvertedIndex():
@@ -34,3 +38,58 @@ def test_InvertedIndex():
 
     sup_zxyi = index.support({Item("z"), Item("x"), Item("y"), Item("i")})
     assert(sup_zxyi == 1 / 6)
+
+
+def test_InvertedIndex_cache():
+    data = ("a,b,c\n"
+            "a,b\n"
+            "b,c\n"
+            "a,c\n")
+    # Four transactions' bitmaps take a byte each.
+    index = InvertedIndex(cache_bytes=2)
+    index.load(data)
+    itemsets = [ItemSet(s) for s in ["ab", "bc", "ac", "abc", "ab", "ca"]]
+    counts = [2, 2, 2, 1, 2, 2]
+    for (itemset, count) in zip(itemsets, counts):
+        assert(index.count(itemset) == count)
+        assert(len(index.intersections) <= 2)
+
+    # Adding transactions invalidates the bitmaps already counted.
+    index.add(ItemSet("abc"))
+    assert(index.count(ItemSet("abc")) == 2)
+    assert(index.support(ItemSet("a")) == 4 / 5)
+
+
+def test_InvertedIndex_batches():
+    data = ("a,b,c\n"
+            "b, c,b\n"
+            "\n"
+            "d\n"
+            "\"e,f\",a\n")
+    path = os.path.join(tempfile.mkdtemp(), "transactions.csv")
+    with open(path, "w") as csv_file:
+        csv_file.write(data)
+    loaded = InvertedIndex()
+    loaded.load_csv(path)
+    added = InvertedIndex()
+    with open(path, newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            added.add([Item(name) for name in row])
+    for index in [loaded, added]:
+        assert(index.num_transactions == 5)
+        assert(list(index.transaction_ids(Item("b"))) == [0, 1])
+        assert(list(index.transaction_ids(Item("e,f"))) == [4])
+        assert(index.count(ItemSet("bc")) == 2)
+
+    # Batches of transactions are appended after those already added.
+    loaded.add_transactions([ItemSet("ab"), ItemSet("b")])
+    assert(list(loaded.transaction_ids(Item("b"))) == [0, 1, 5, 6])
+    assert(loaded.count(ItemSet("ab")) == 2)
+
+    vocabulary = Vocabulary()
+    transactions = load_transactions(path, vocabulary)
+    index = InvertedIndex()
+    index.add_transactions(transactions)
+    index.add_transactions(transactions.window(0, 2))
+    b = vocabulary.intern("b")
+    assert(list(index.transaction_ids(b)) == [0, 1, 5, 6])
@@ -0,0 +1,43 @@
+import shutil
+from collections import Counter
+from multistreamdetection import DoneMessage, DriftMessage
+from multistreamdetection import run_streams, stream_args
+from virtualchangedetection import detect_drifts, make_arg_parser
+
+
+def test_multiple_streams(tmp_path):
+    args = make_arg_parser("test", input_args=False).parse_args([
+        "--min-confidence", "0.95",
+        "--min-support", "0.9",
+        "--min-lift", "1.0",
+        "--training-window-size", "500",
+        "--drift-algorithm", "prochange",
+        "--disable-save-rules",
+    ])
+    args.output = "rules.csv"
+    # The inputs are copied so that their transaction caches are written
+    # there.
+    inputs = [shutil.copy(path, tmp_path)
+              for path in ["datasets/mushroom.csv", "datasets/UCI-zoo.csv"]]
+
+    expected = dict()
+    for path in inputs:
+        metrics = Counter()
+        drifts = [(transaction_num, drift.drift_type)
+                  for (transaction_num, drift)
+                  in detect_drifts(stream_args(args, path), print, metrics)]
+        expected[path.split("/")[-1][:-4]] = (drifts, metrics["transactions"])
+
+    drifts = {name: [] for name in expected}
+    transactions = dict()
+    for message in run_streams(args, inputs, 2):
+        if message[0] == DriftMessage:
+            (_, name, transaction_num, drift) = message
+            drifts[name].append((transaction_num, drift.drift_type))
+        else:
+            assert(message[0] == DoneMessage)
+            (_, name, metrics) = message
+            transactions[name] = metrics["transactions"]
+    assert(expected == {name: (drifts[name], transactions[name])
+                        for name in expected})
+    assert(len(drifts["mushroom"]) > 0)
@@ -0,0 +1,70 @@
+import os
+import rulestore
+import tempfile
+from item import Item, ItemSet, Vocabulary
+from rulestore import BinaryRuleFormat, CsvRuleFormat
+from rulestore import load_rule_tree, make_rule_writer, read_rules
+
+
+def test_rule_store_round_trip():
+    rules = [
+        (ItemSet("abc"), ItemSet("d"), 0.75, 1.5, 0.25),
+        (ItemSet("a"), ItemSet("b"), 0.5, 1.25, 0.125),
+        (ItemSet("de"), ItemSet("g"), 1.0, 2.0, 0.5),
+    ]
+    directory = tempfile.mkdtemp()
+    for rule_format in [CsvRuleFormat, BinaryRuleFormat]:
+        for compress in [False, True]:
+            path = os.path.join(directory, "{}.{}".format(rule_format,
+                                                          compress))
+            with make_rule_writer(path, rule_format, None, compress) as writer:
+                for rule in rules:
+                    writer.write(rule)
+            assert(list(read_rules(path)) == rules)
+            tree = load_rule_tree(path)
+            assert({(frozenset(a), c) for (a, c) in tree.rules()} ==
+                   {(a, next(iter(c))) for (a, c, _, _, _) in rules})
+
+
+def test_rule_store_vocabulary():
+    vocabulary = Vocabulary()
+    rules = [
+        (frozenset(vocabulary.encode(["x", "y"])),
+         frozenset(vocabulary.encode(["z"])), 0.5, 1.5, 0.25),
+    ]
+    directory = tempfile.mkdtemp()
+    for rule_format in [CsvRuleFormat, BinaryRuleFormat]:
+        path = os.path.join(directory, rule_format)
+        with make_rule_writer(path, rule_format, vocabulary) as writer:
+            for rule in rules:
+                writer.write(rule)
+        assert(list(read_rules(path, vocabulary)) == rules)
+        assert(list(read_rules(path)) == [
+            (ItemSet("xy"), ItemSet("z"), 0.5, 1.5, 0.25)])
+
+
+def test_rule_store_blocks():
+    # Binary rules are written out in blocks as they're passed in, with
+    # item ids numbered by the writer rather than interned in the
+    # vocabulary passed.
+    vocabulary = Vocabulary()
+    rules = [(frozenset(vocabulary.encode([str(i), str(i + 1)])),
+              frozenset(vocabulary.encode([str(i + 2)])), 0.5, 1.5, 0.25)
+             for i in range(10)]
+    num_items = len(vocabulary)
+    path = os.path.join(tempfile.mkdtemp(), "rules")
+    block_size = rulestore.BINARY_WRITE_BLOCK_SIZE
+    rulestore.BINARY_WRITE_BLOCK_SIZE = 4
+    try:
+        with make_rule_writer(path, BinaryRuleFormat, vocabulary) as writer:
+            for rule in rules:
+                writer.write(rule)
+            assert(writer.num_blocks == 2)
+    finally:
+        rulestore.BINARY_WRITE_BLOCK_SIZE = block_size
+    assert(len(vocabulary) == num_items)
+    assert(list(read_rules(path)) ==
+           [(frozenset(Item(vocabulary.name_of(i)) for i in a),
+             frozenset(Item(vocabulary.name_of(i)) for i in c),
+             confidence, lift, support)
+            for (a, c, confidence, lift, support) in rules])
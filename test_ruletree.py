@@ -1,5 +1,8 @@
-from ruletree import RuleTree
-from item import Item, ItemSet
+import numpy
+from collections import deque
+from ruletree import MatchWindow, RuleTree
+from transactionstore import TransactionStore
+from item import Item, ItemSet, Vocabulary
 
 
 def ItemList(s):
@@ -37,3 +40,106 @@ def test_basic_rule_tree():
         for (a, c) in tree.rules():
             print("  {} -> {} ; {}".format(a, c, tree.match_count_of(a, c)))
         assert(expected_results == tree.match_vector())
+
+
+def test_rule_tree_item_ids():
+    # Rules over interned ids; consequents which sort before their
+    # antecedents must still match.
+    vocabulary = Vocabulary()
+    rules = [("b", "a"), ("bc", "a"), ("a", "c")]
+    tree = RuleTree()
+    for (antecedent, consequent) in rules:
+        tree.insert(vocabulary.encode(antecedent),
+                    vocabulary.encode(consequent))
+    for transaction in ["abc", "ab", "bd"]:
+        tree.record_matches(vocabulary.encode(transaction))
+    (a, b, c) = map(vocabulary.intern, "abc")
+    assert(tree.match_count_of((b,), a) == 2)
+    assert(tree.match_count_of(tuple(sorted((b, c))), a) == 1)
+    assert(tree.match_count_of((a,), c) == 1)
+    assert(tree.rag_bag() == 1 / 3)
+
+
+def test_record_matches_batch():
+    rules = [
+        ("abc", "d"),
+        ("abc", "f"),
+        ("ac", "g"),
+        ("bc", "d"),
+        ("de", "g"),
+    ]
+    transactions = ["abcd", "geabcd", "abc", "bcd", "def", "geab", "xy",
+                    "acg", "bcdf", "", "abcfg", "deg"]
+    transactions = list(map(ItemSet, transactions))
+    for window_size in [None, 4]:
+        trees = [RuleTree(window_size), RuleTree(window_size)]
+        for tree in trees:
+            for (antecedent, consequent) in rules:
+                tree.insert(ItemSet(antecedent), ItemSet(consequent))
+        for start in range(0, len(transactions), 5):
+            block = transactions[start:start + 5]
+            for transaction in block:
+                trees[0].record_matches(transaction)
+            trees[1].record_matches_batch(block)
+            assert(trees[0].match_vector() == trees[1].match_vector())
+            assert(trees[0].rag_bag() == trees[1].rag_bag())
+
+
+def test_record_matches_store():
+    vocabulary = Vocabulary()
+    rules = [("abc", "d"), ("ac", "g"), ("de", "g")]
+    transactions = ["abcd", "geabcd", "xy", "acg", "", "deg", "abx", "z"]
+    transactions = [sorted(vocabulary.encode(t)) for t in transactions]
+    store = TransactionStore(
+        numpy.cumsum([0] + list(map(len, transactions))),
+        numpy.array(sum(transactions, []), dtype=numpy.int32))
+    for window_size in [None, 3]:
+        trees = [RuleTree(window_size), RuleTree(window_size)]
+        for tree in trees:
+            for (antecedent, consequent) in rules:
+                tree.insert(vocabulary.encode(antecedent),
+                            vocabulary.encode(consequent))
+        for start in range(0, len(transactions), 3):
+            trees[0].record_matches_batch(transactions[start:start + 3])
+            trees[1].record_matches_batch(store.window(start, start + 3))
+            assert(trees[0].match_vector() == trees[1].match_vector())
+            assert(trees[0].rag_bag() == trees[1].rag_bag())
+
+
+def test_rule_tree_copy():
+    tree = RuleTree()
+    tree.insert(ItemSet("ab"), ItemSet("c"))
+    tree.insert(ItemSet("a"), ItemSet("b"))
+    tree.record_matches(ItemSet("abc"))
+    copied = tree.copy()
+    cleared = tree.copy(with_counts=False)
+    assert(copied.matcher is tree.matcher and cleared.root is tree.root)
+    copied.record_matches(ItemSet("ab"))
+    cleared.record_matches(ItemSet("ab"))
+    assert(tree.match_vector() == [1, 1])
+    assert(copied.match_vector() == [1, 0.5])
+    assert(cleared.match_vector() == [1, 0])
+
+
+def test_match_window():
+    # The window's ring buffers wrap around and grow, and batches larger
+    # than the window evict their own first transactions.
+    window = MatchWindow(3)
+    expected = deque()
+    batches = [[[1, 2], []], [[3, 4, 5, 6]], [[7], [8, 9], [], [10]],
+               [[11, 12, 13, 14, 15, 16, 17]], [[18], [19]]]
+    for batch in batches:
+        offsets = numpy.cumsum([0] + list(map(len, batch)))
+        matched = numpy.array(sum(batch, []), dtype=numpy.int32)
+        evicted = []
+        for transaction in batch:
+            expected.append(transaction)
+            if len(expected) > 3:
+                evicted.append(expected.popleft())
+        (ids, lengths) = window.extend(matched, offsets)
+        assert(ids.tolist() == sum(evicted, []))
+        assert(lengths.tolist() == list(map(len, evicted)))
+        assert(len(window) == len(expected))
+    copied = window.copy()
+    assert(window.append(numpy.array([20])).tolist() == expected[0])
+    assert(copied.append(numpy.array([20])).tolist() == expected[0])
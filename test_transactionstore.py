@@ -0,0 +1,92 @@
+import csv
+import numpy
+import os
+import pickle
+import shutil
+from item import Vocabulary
+from transactionstore import cache_path, load_transactions, parse_csv
+from transactionstore import read_cache, write_transactions
+
+
+def read_csv(path, vocabulary):
+    with open(path, newline='') as csv_file:
+        return list(map(vocabulary.encode, csv.reader(csv_file)))
+
+
+def test_load_transactions(tmp_path):
+    path = str(tmp_path / "transactions.csv")
+    with open(path, "w") as csv_file:
+        csv_file.write("a,b,c\nc, b,b\n\nd\n\"e,f\",a\n")
+    quoted = read_csv(path, Vocabulary())
+    assert(list(load_transactions(path, Vocabulary())) == quoted)
+    # Without a cache, transactions are mapped from a temporary file.
+    assert(isinstance(load_transactions(path, Vocabulary()).items,
+                      numpy.memmap))
+    assert(not os.path.exists(cache_path(path)))
+
+    shutil.copy("datasets/mushroom.csv", path)
+    vocabulary = Vocabulary()
+    expected = read_csv(path, vocabulary)
+    for _ in range(2):
+        # Parsed, then loaded from the cache.
+        loaded_vocabulary = Vocabulary()
+        transactions = load_transactions(path, loaded_vocabulary, cache=True)
+        assert(os.path.exists(cache_path(path)))
+        assert(list(transactions) == expected)
+        assert(loaded_vocabulary.id_to_name == vocabulary.id_to_name)
+    assert(isinstance(transactions.items, numpy.memmap))
+
+    # Ids already interned in the vocabulary are kept.
+    other = Vocabulary()
+    other.intern("x")
+    other.intern(vocabulary.name_of(5))
+    transactions = list(load_transactions(path, other, cache=True))
+    assert([sorted(map(other.name_of, t)) for t in transactions] ==
+           [sorted(map(vocabulary.name_of, t)) for t in expected])
+    assert(all(list(t) == sorted(t) for t in transactions))
+
+    # A cache made from an older version of the file isn't used.
+    with open(path, "a") as csv_file:
+        csv_file.write("x,y\n")
+    transactions = list(load_transactions(path, Vocabulary(), cache=True))
+    assert(len(transactions) == len(expected) + 1)
+
+    # Nor is a truncated one; it's written again.
+    size = os.path.getsize(cache_path(path))
+    with open(cache_path(path), "r+b") as cache_file:
+        cache_file.truncate(size - 100)
+    transactions = list(load_transactions(path, Vocabulary(), cache=True))
+    assert(len(transactions) == len(expected) + 1)
+    assert(os.path.getsize(cache_path(path)) == size)
+
+
+def test_parse_chunks(tmp_path):
+    # Parsing a chunk at a time numbers items across chunks, and writes the
+    # same cache.
+    path = "datasets/mushroom.csv"
+    (offsets, items, names) = parse_csv(path)
+    (chunked_offsets, chunked_items, chunked_names) = parse_csv(path, 1000)
+    assert(numpy.array_equal(offsets, chunked_offsets))
+    assert(numpy.array_equal(items, chunked_items))
+    assert(names == chunked_names)
+    stat = os.stat(path)
+    for chunk_size in [1000, 1 << 24]:
+        cache = str(tmp_path / "{}.cache".format(chunk_size))
+        with open(cache, "wb") as cache_file:
+            write_transactions(path, cache_file, stat, chunk_size)
+        (cached_offsets, cached_items, cached_names) = read_cache(cache, stat)
+        assert(numpy.array_equal(offsets, cached_offsets))
+        assert(numpy.array_equal(items, cached_items))
+        assert(names == cached_names)
+
+
+def test_window():
+    vocabulary = Vocabulary()
+    expected = read_csv("datasets/UCI-zoo.csv", vocabulary)
+    transactions = load_transactions("datasets/UCI-zoo.csv", Vocabulary())
+    for (start, stop) in [(0, 10), (7, 40), (90, 200), (200, 300)]:
+        window = transactions.window(start, stop)
+        assert(list(window) == expected[start:stop])
+        assert(numpy.shares_memory(window.items, transactions.items) or
+               len(window.items) == 0)
+        assert(list(pickle.loads(pickle.dumps(window))) == list(window))
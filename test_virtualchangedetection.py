@@ -0,0 +1,80 @@
+import shutil
+from collections import Counter
+from datasetreader import DatasetReader
+from fptree import mine_fp_tree
+from generaterules import generate_rules
+from virtualchangedetection import detect_drifts, make_arg_parser, quiet
+from virtualchangedetection import mine_rules
+
+
+def test_detect_drifts(tmp_path):
+    # The input is copied so that its transaction cache is written there.
+    shutil.copy("datasets/mushroom.csv", tmp_path)
+    args = make_arg_parser("test").parse_args([
+        "--input", str(tmp_path / "mushroom.csv"),
+        "--output", "rules.csv",
+        "--min-confidence", "0.95",
+        "--min-support", "0.9",
+        "--min-lift", "1.0",
+        "--training-window-size", "500",
+        "--drift-algorithm", "prochange",
+        "--disable-save-rules",
+    ])
+    metrics = Counter()
+    drifts = [transaction_num
+              for (transaction_num, drift)
+              in detect_drifts(args, quiet, metrics)]
+    assert(len(drifts) > 0)
+    assert(metrics["drifts"] == len(drifts))
+    assert(metrics["windows"] == len(drifts) + 1)
+    assert(metrics["transactions"] == 8124)
+
+
+def test_incremental_mining(tmp_path):
+    # After each drift, the incremental miner slides along to the window
+    # ending at the drift, rather than mining the one starting there.
+    shutil.copy("datasets/mushroom.csv", tmp_path)
+    args = make_arg_parser("test").parse_args([
+        "--input", str(tmp_path / "mushroom.csv"),
+        "--output", "rules.csv",
+        "--min-confidence", "0.95",
+        "--min-support", "0.9",
+        "--min-lift", "1.0",
+        "--training-window-size", "500",
+        "--drift-algorithm", "prochange",
+        "--disable-save-rules",
+        "--incremental-mining",
+    ])
+    logged = []
+
+    def log(line, **kwargs):
+        logged.append(line)
+    drifts = [transaction_num
+              for (transaction_num, drift) in detect_drifts(args, log)]
+    assert(len(drifts) > 0)
+    windows = [line for line in logged if line.startswith("Mining window")]
+    assert(windows[1:] == ["Mining window [{},{}]".format(end - 500, end)
+                           for end in drifts])
+
+
+def test_mine_rules_from_stream():
+    # Rules are generated from the itemset stream in the default FP-Growth
+    # mode, and must be the same as those generated from the mined itemsets.
+    transactions = list(DatasetReader("datasets/mushroom.csv"))
+    args = make_arg_parser("test").parse_args([
+        "--input", "datasets/mushroom.csv",
+        "--output", "rules.csv",
+        "--min-confidence", "0.5",
+        "--min-support", "0.3",
+        "--min-lift", "1.0",
+        "--training-window-size", "500",
+    ])
+    metrics = Counter()
+    rules = mine_rules(args, transactions, log=quiet, metrics=metrics)
+    (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+        transactions, 0.3)
+    expected = generate_rules(
+        itemsets, itemset_counts, num_transactions, 0.5, 1.0)
+    assert(len(rules) == len(expected))
+    assert(set(rules) == expected)
+    assert(metrics["rules"] == len(expected))
@@ -0,0 +1,73 @@
+import numpy
+import random
+from scipy import stats
+from volatilitydetector import MAX_NUM_PATTERN_SAMPLES
+from volatilitydetector import Pattern
+from volatilitydetector import PatternNetwork
+from volatilitydetector import VolatilityDetector
+
+
+def test_pattern_samples():
+    # Outliers are removed, and the oldest samples dropped, as if the
+    # samples were kept in a list.
+    random.seed(1)
+    expected = []
+    pattern = Pattern(1)
+    for _ in range(3 * MAX_NUM_PATTERN_SAMPLES):
+        sample = random.choice([1000, 1010, 1020, 1500, 40])
+        expected.append(sample)
+        if len(expected) > 5:
+            (quartile_1, quartile_3) = numpy.percentile(expected, [25, 75])
+            iqr = quartile_3 - quartile_1
+            expected = [x for x in expected
+                        if quartile_1 - iqr * 1.5 <= x <= quartile_3 + iqr * 1.5]
+        if len(expected) > MAX_NUM_PATTERN_SAMPLES:
+            expected.pop(0)
+        pattern.add_sample(sample)
+        assert(list(pattern.samples()) == expected)
+        assert(list(pattern.sorted_samples[:pattern.size]) == sorted(expected))
+        assert(pattern.mean() == sum(expected) / len(expected))
+
+
+def test_pattern_network_similarity():
+    random.seed(2)
+    network = PatternNetwork()
+    transaction_num = 0
+    for _ in range(200):
+        transaction_num += random.choice([1000, 2000, 5000]) + \
+            random.randint(-100, 100)
+        network.add(transaction_num)
+    for drift_interval in [500, 1000, 1950, 5000, 5100]:
+        similarities = network.similarities(drift_interval)
+        for (pattern, p_value) in zip(network.patterns.values(),
+                                      similarities):
+            (_, expected) = stats.ks_2samp(numpy.array([drift_interval]),
+                                           pattern.samples())
+            assert(p_value == expected)
+            assert(pattern.ks_test(drift_interval) == expected)
+            assert(numpy.shares_memory(network.sorted_samples[pattern.row],
+                                       pattern.sorted_samples))
+
+
+def test_drift_confidence():
+    # The cached distributions give the confidence computed from the two
+    # nearest expected drifts with scipy.
+    random.seed(3)
+    detector = VolatilityDetector()
+    assert(detector.drift_confidence(100) == 1.0)
+    transaction_num = 0
+    for _ in range(50):
+        transaction_num += random.choice([1000, 1500, 3000]) + \
+            random.randint(-100, 100)
+        detector.add(transaction_num)
+        for probe in range(transaction_num + 32, transaction_num + 4000, 96):
+            connections = detector.pattern_network.likely_connections_at(
+                10, 2, probe)
+            if len(connections) == 0:
+                assert(detector.drift_confidence(probe) == 1.0)
+                continue
+            max_pdf = max(stats.norm.pdf(position, position, interval / 2)
+                          for (position, interval) in connections)
+            pdf = max(stats.norm.pdf(probe, position, interval / 2)
+                      for (position, interval) in connections)
+            assert(detector.drift_confidence(probe) == pdf / max_pdf)
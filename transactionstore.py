@@ -0,0 +1,329 @@
+import csv
+import io
+import numpy
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+if sys.version_info[0] < 3:
+    raise Exception("Python 3 or a more recent version is required.")
+
+# Parsed transactions are cached next to their CSV file, in a file laid out
+# as the header; the magic, the size and modification time of the CSV file
+# the cache was made from, the number of transactions, the number of item
+# ids, and the length of the vocabulary; then the transactions' item ids as
+# int32, padded to a multiple of 8 bytes, their offsets as int64, and the
+# vocabulary's item names, one per line, the line number being the item id.
+# The item ids come first so that the cache can be written as the CSV file
+# is parsed, a chunk at a time. The offsets and item ids are memory mapped
+# when the cache is loaded.
+CACHE_MAGIC = b"TXNCSR02"
+CACHE_HEADER = struct.Struct("<8sqqqqq")
+
+# Number of transactions' offsets converted from NumPy at a time while
+# iterating.
+ITERATION_CHUNK_SIZE = 65536
+
+# Approximate number of bytes of a CSV file split at a time by
+# read_csv_chunks().
+CSV_CHUNK_SIZE = 1 << 20
+
+
+def cache_path(csv_file_path):
+    return csv_file_path + ".cache"
+
+
+class TransactionStore:
+    # Transactions in compressed sparse row form; the sorted item ids of
+    # transaction i are items[offsets[i]:offsets[i + 1]]. Item ids are those
+    # of the Vocabulary the transactions were loaded with.
+    def __init__(self, offsets, items):
+        self.offsets = offsets
+        self.items = items
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def window(self, start, stop):
+        # Returns a TransactionStore of transactions [start, stop), clamped
+        # to the store's length, whose items are a view of ours; so a
+        # window of a memory mapped store is too, and only its offsets are
+        # copied. Windows pickle as just their own transactions.
+        start = min(start, len(self))
+        stop = max(start, min(stop, len(self)))
+        first = self.offsets[start]
+        return TransactionStore(
+            numpy.subtract(self.offsets[start:stop + 1], first,
+                           dtype=numpy.int64),
+            self.items[first:self.offsets[stop]])
+
+    def transaction(self, index):
+        transaction = array('i')
+        transaction.frombytes(
+            self.items[self.offsets[index]:self.offsets[index + 1]].tobytes())
+        return transaction
+
+    def __iter__(self):
+        # Yields each transaction as an array('i'), as DatasetReader does.
+        # Transactions are copied straight out of the items' buffer, which
+        # may be memory mapped.
+        items = memoryview(numpy.ascontiguousarray(self.items)).cast('B')
+        for chunk in range(0, len(self), ITERATION_CHUNK_SIZE):
+            offsets = self.offsets[
+                chunk:chunk + ITERATION_CHUNK_SIZE + 1].tolist()
+            for index in range(len(offsets) - 1):
+                transaction = array('i')
+                transaction.frombytes(
+                    items[4 * offsets[index]:4 * offsets[index + 1]])
+                yield transaction
+
+
+def load_transactions(csv_file_path, vocabulary, cache=False):
+    # Returns a TransactionStore of the transactions in a CSV file, with
+    # their items interned in vocabulary. If cache is True, the parsed
+    # transactions are memory mapped from the file's cache if it's up to
+    # date, else the cache is written as the file is parsed, and then
+    # mapped. Otherwise, or if the cache can't be written, they're parsed
+    # into a temporary file laid out as a cache, which is mapped the same
+    # way; so either way, memory use doesn't grow with the file's length.
+    # The exception is when vocabulary already holds items which the file's
+    # ids don't match, when the mapped ids are copied into memory.
+    stat = os.stat(csv_file_path)
+    loaded = None
+    if cache:
+        path = cache_path(csv_file_path)
+        loaded = read_cache(path, stat)
+        if loaded is None:
+            loaded = write_cache(path, csv_file_path, stat)
+    if loaded is None:
+        loaded = map_temporary_cache(csv_file_path, stat)
+    if loaded is None:
+        loaded = parse_csv(csv_file_path)
+    (offsets, items, names) = loaded
+    # The file's item ids are assigned in the order the items first appear,
+    # so an empty vocabulary interns them to the same ids.
+    mapping = numpy.array(list(map(vocabulary.intern, names)),
+                          dtype=numpy.int32)
+    if not numpy.array_equal(mapping, numpy.arange(len(names))):
+        items = sort_rows(offsets, mapping[items])
+    return TransactionStore(offsets, items)
+
+
+def parse_csv(csv_file_path, chunk_size=CSV_CHUNK_SIZE):
+    # Returns (offsets, items, names) for the transactions in a CSV file,
+    # where names are the item names in the order they first appear, and
+    # items are indexes into names.
+    offsets = [numpy.zeros(1, dtype=numpy.int64)]
+    items = [numpy.zeros(0, dtype=numpy.int32)]
+    names = []
+    num_items = 0
+    for (chunk_offsets, chunk_items, new_names) in parse_csv_chunks(
+            csv_file_path, chunk_size):
+        offsets.append(chunk_offsets[1:] + num_items)
+        items.append(chunk_items)
+        names.extend(new_names)
+        num_items += len(chunk_items)
+    return (numpy.concatenate(offsets), numpy.concatenate(items), names)
+
+
+def parse_csv_chunks(csv_file_path, chunk_size=CSV_CHUNK_SIZE):
+    # Yields (offsets, items, new_names) for each chunk of the transactions
+    # in a CSV file, as read_csv_chunks() splits it. Items are numbered in
+    # the order they first appear in the file, and new_names are the names
+    # of those which first appear in the chunk. Item names are stripped of
+    # whitespace, and duplicate items within a transaction are dropped, as
+    # Vocabulary.encode() does.
+    index = dict()
+    for (fields, tokens) in read_csv_chunks(csv_file_path, chunk_size):
+        new_names = []
+        for name in dict.fromkeys(tokens):
+            if name not in index:
+                index[name] = len(index)
+                new_names.append(name.decode())
+        items = numpy.fromiter(map(index.__getitem__, tokens),
+                               dtype=numpy.int32,
+                               count=len(tokens))
+        offsets = numpy.zeros(len(fields) + 1, dtype=numpy.int64)
+        numpy.cumsum(fields, out=offsets[1:])
+        (offsets, items) = sort_rows(offsets, items, dedupe=True)
+        yield (offsets, items, new_names)
+
+
+def read_csv_chunks(csv_file_path, chunk_size=CSV_CHUNK_SIZE):
+    # Yields (fields, tokens), as split_rows() returns them, for successive
+    # chunks of about chunk_size bytes of a CSV file. Chunks end at line
+    # ends, so quoted item names can't span lines.
+    with open(csv_file_path, "rb") as csv_file:
+        while True:
+            lines = csv_file.readlines(chunk_size)
+            if len(lines) == 0:
+                break
+            yield split_rows(b"".join(lines))
+
+
+def split_rows(data):
+    # Splits CSV data into (fields, tokens); the number of items on each
+    # line, and the item names, as bytes stripped of whitespace.
+    if b'"' in data:
+        # Quoted fields need the csv module to split them.
+        rows = [[field.encode() for field in row]
+                for row in csv.reader(io.StringIO(data.decode(), newline=''))]
+        fields = [len(row) for row in rows]
+        tokens = [field for row in rows for field in row]
+    else:
+        lines = data.replace(b"\r\n", b"\n").split(b"\n")
+        if len(lines) > 0 and lines[-1] == b"":
+            lines.pop()
+        fields = [line.count(b",") + 1 if len(line) > 0 else 0
+                  for line in lines]
+        tokens = b",".join(
+            line for line in lines if len(line) > 0).split(b",")
+        if len(tokens) == 1 and tokens[0] == b"":
+            tokens = []
+    if any(c in data for c in (b" ", b"\t")):
+        tokens = [token.strip() for token in tokens]
+    return (fields, tokens)
+
+
+def sort_rows(offsets, items, dedupe=False):
+    # Sorts the item ids within each transaction. If dedupe is True, drops
+    # duplicate items too, and returns the new (offsets, items), else
+    # returns the sorted items.
+    # Sort on the row and item packed into one key.
+    stride = int(items.max()) + 1 if len(items) > 0 else 1
+    rows = numpy.repeat(numpy.arange(len(offsets) - 1, dtype=numpy.int64),
+                        numpy.diff(offsets))
+    keys = numpy.sort(rows * stride + items)
+    items = (keys % stride).astype(numpy.int32)
+    if not dedupe:
+        return items
+    rows = keys // stride
+    keep = numpy.ones(len(items), dtype=bool)
+    keep[1:] = (items[1:] != items[:-1]) | (rows[1:] != rows[:-1])
+    counts = numpy.bincount(rows[keep], minlength=len(offsets) - 1)
+    numpy.cumsum(counts, out=offsets[1:])
+    return (offsets, items[keep])
+
+
+def cache_offsets_start(num_items):
+    # Item ids are padded so that the offsets which follow them are aligned.
+    return CACHE_HEADER.size + 8 * ((num_items + 1) // 2)
+
+
+def read_cache(path, stat):
+    # Returns (offsets, items, names) from the cache at path, with offsets
+    # and items memory mapped, or None if there's no cache, it wasn't made
+    # from the CSV file as it is now, or it's truncated or corrupt.
+    try:
+        with open(path, "rb") as cache_file:
+            return map_cache(cache_file, stat)
+    except FileNotFoundError:
+        return None
+
+
+def map_cache(cache_file, stat):
+    header = cache_file.read(CACHE_HEADER.size)
+    if len(header) != CACHE_HEADER.size:
+        return None
+    (magic, size, mtime, num_transactions, num_items,
+     vocabulary_size) = CACHE_HEADER.unpack(header)
+    if (magic != CACHE_MAGIC or size != stat.st_size or
+            mtime != stat.st_mtime_ns):
+        return None
+    if num_transactions < 0 or num_items < 0 or vocabulary_size < 0:
+        return None
+    offsets_start = cache_offsets_start(num_items)
+    vocabulary_start = offsets_start + 8 * (num_transactions + 1)
+    if (os.fstat(cache_file.fileno()).st_size !=
+            vocabulary_start + vocabulary_size):
+        return None
+    cache_file.seek(vocabulary_start)
+    try:
+        vocabulary = cache_file.read(vocabulary_size).decode()
+    except UnicodeDecodeError:
+        return None
+    offsets = numpy.memmap(cache_file, dtype="<i8", mode="r",
+                           offset=offsets_start,
+                           shape=(num_transactions + 1,))
+    items = numpy.memmap(cache_file, dtype="<i4", mode="r",
+                         offset=CACHE_HEADER.size,
+                         shape=(num_items,)) if num_items > 0 else (
+        numpy.zeros(0, dtype=numpy.int32))
+    if offsets[0] != 0 or offsets[-1] != num_items:
+        return None
+    names = vocabulary.split("\n") if len(vocabulary) > 0 else []
+    return (offsets, items, names)
+
+
+def write_cache(path, csv_file_path, stat):
+    # Parses the CSV file into a cache at path, and returns it as
+    # read_cache() does, or None if the cache couldn't be written.
+    # Write to a temporary file and rename it into place, so that other
+    # processes never see a partly written cache.
+    temporary_path = "{}.{}".format(path, os.getpid())
+    try:
+        with open(temporary_path, "wb") as cache_file:
+            write_transactions(csv_file_path, cache_file, stat)
+        os.replace(temporary_path, path)
+    except (OSError, ValueError):
+        # Caching is only an optimisation; e.g. the input's directory may
+        # not be writable.
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return None
+    return read_cache(path, stat)
+
+
+def map_temporary_cache(csv_file_path, stat):
+    # Parses the CSV file into an unnamed file in the temporary directory,
+    # laid out as a cache, and returns it as read_cache() does, or None if
+    # it couldn't be written. The file is deleted once it's unmapped.
+    try:
+        with tempfile.TemporaryFile() as cache_file:
+            write_transactions(csv_file_path, cache_file, stat)
+            return map_cache(cache_file, stat)
+    except (OSError, ValueError):
+        return None
+
+
+def write_transactions(csv_file_path, cache_file, stat,
+                       chunk_size=CSV_CHUNK_SIZE):
+    # Parses the transactions in a CSV file into cache_file, a binary file,
+    # laid out as a cache, a chunk at a time. The chunks' offsets are kept
+    # in a temporary file until all of the item ids have been written, so
+    # only the current chunk's transactions are held in memory. Raises
+    # ValueError if an item name can't be written one per line.
+    cache_file.write(bytes(CACHE_HEADER.size))
+    names = []
+    num_transactions = 0
+    num_items = 0
+    with tempfile.TemporaryFile() as offsets_file:
+        offsets_file.write(numpy.zeros(1, dtype="<i8").tobytes())
+        for (offsets, items, new_names) in parse_csv_chunks(
+                csv_file_path, chunk_size):
+            if any("\n" in name for name in new_names):
+                raise ValueError("Item names can't contain newlines")
+            cache_file.write(items.astype("<i4").tobytes())
+            offsets_file.write(
+                (offsets[1:] + num_items).astype("<i8").tobytes())
+            names.extend(new_names)
+            num_transactions += len(offsets) - 1
+            num_items += len(items)
+        cache_file.write(bytes(cache_offsets_start(num_items) -
+                               CACHE_HEADER.size - 4 * num_items))
+        offsets_file.seek(0)
+        shutil.copyfileobj(offsets_file, cache_file)
+    vocabulary = "\n".join(names).encode()
+    cache_file.write(vocabulary)
+    cache_file.seek(0)
+    cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC,
+                                       stat.st_size,
+                                       stat.st_mtime_ns,
+                                       num_transactions,
+                                       num_items,
+                                       len(vocabulary)))
+    cache_file.flush()
+    cache_file.seek(0)
@@ -8,35 +8,42 @@
 #       --training-window-size 2500 \
 #       --drift-algorithm prochange
 
+import logging
 import sys
 import time
 import tracemalloc
+from collections import Counter
+from itertools import islice
 from argparse import ArgumentParser
 from argparse import ArgumentTypeError
 from fptree import mine_fp_tree
+from fptree import mine_fp_tree_iter
+from fptree import FP_TREE_ENGINES
+from fptree import NodeTreeEngine
+from fptree import FPGrowthMiningAlgorithm
+from eclat import DEclatMiningAlgorithm
+from eclat import EclatMiningAlgorithm
+from eclat import mine_eclat
+from incrementalfptree import IncrementalFPGrowth
 from generaterules import generate_rules
-from datasetreader import DatasetReader
-from itertools import islice
+from generaterules import generate_rules_from_stream
+from item import Vocabulary
+from rulestore import CsvRuleFormat
+from rulestore import RULE_WRITERS
+from rulestore import make_rule_writer
 from driftdetector import DriftDetector
+from driftdetector import SAMPLE_INTERVAL
 from driftdetector import SeedDriftAlgorithm
 from driftdetector import ProChangeDriftAlgorithm
 from driftdetector import ProSeedDriftAlgorithm
 from driftdetector import VRChangeDriftAlgorithm
 from seeddriftdetector import SeedDriftDetector
+from transactionstore import load_transactions
 from volatilitydetector import ProSeedVolatilityDetector
 from volatilitydetector import VolatilityDetector
 from volatilitydetector import FixedConfidenceVolatilityDetector
 
 
-def set_to_string(s):
-    ss = ""
-    for x in sorted(s):
-        if ss != "":
-            ss += " "
-        ss += str(x)
-    return ss
-
-
 def float_between_0_and_1(string):
     value = float(string)
     if value < 0.0 or value > 1.0:
@@ -65,16 +72,49 @@ def valid_drift_algorithm(value):
     return value
 
 
-def take(n, iterable):
-    "Return first n items of the iterable as a list"
-    return list(islice(iterable, n))
+def valid_mining_algorithm(value):
+    valid_algorithms = [
+        FPGrowthMiningAlgorithm,
+        EclatMiningAlgorithm,
+        DEclatMiningAlgorithm]
+    if value not in valid_algorithms:
+        msg = "{} is not in valid mining algorithms {}".format(
+            value, valid_algorithms)
+        raise ArgumentTypeError(msg)
+    return value
 
 
-def parse_args():
-    parser = ArgumentParser(
-        description="Association rule data mining in Python - Virtual change detection")
-    parser.add_argument("--input", dest="input", required=True)
-    parser.add_argument("--output", dest="output", required=True)
+def valid_fp_tree_engine(value):
+    if value not in FP_TREE_ENGINES:
+        msg = "{} is not in valid engines {}".format(
+            value, list(FP_TREE_ENGINES))
+        raise ArgumentTypeError(msg)
+    return value
+
+
+def valid_log_level(value):
+    valid_levels = ["debug", "info", "warning", "error"]
+    if value not in valid_levels:
+        msg = "{} is not in valid log levels {}".format(value, valid_levels)
+        raise ArgumentTypeError(msg)
+    return value
+
+
+def valid_rule_format(value):
+    if value not in RULE_WRITERS:
+        msg = "{} is not in valid rule formats {}".format(
+            value, list(RULE_WRITERS))
+        raise ArgumentTypeError(msg)
+    return value
+
+
+def make_arg_parser(description, input_args=True):
+    # Returns a parser for the drift detection arguments. If input_args is
+    # False, --input and --output are left for the caller to add.
+    parser = ArgumentParser(description=description)
+    if input_args:
+        parser.add_argument("--input", dest="input", required=True)
+        parser.add_argument("--output", dest="output", required=True)
     parser.add_argument(
         "--drift-algorithm",
         dest="drift_algorithm",
@@ -106,6 +146,39 @@ def parse_args():
         "--generate-maximal-itemsets",
         dest="maximal_itemsets",
         action='store_true')
+    parser.add_argument(
+        "--generate-closed-itemsets",
+        dest="closed_itemsets",
+        action='store_true')
+    parser.add_argument(
+        "--max-itemset-length",
+        dest="max_itemset_length",
+        type=int,
+        required=False,
+        default=None)
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        required=False,
+        default=None)
+    parser.add_argument(
+        "--mining-algorithm",
+        dest="mining_algorithm",
+        type=valid_mining_algorithm,
+        required=False,
+        default=FPGrowthMiningAlgorithm)
+    parser.add_argument(
+        "--fp-tree-engine",
+        dest="fp_tree_engine",
+        type=valid_fp_tree_engine,
+        required=False,
+        default=NodeTreeEngine)
+    parser.add_argument(
+        "--incremental-mining",
+        dest="incremental_mining",
+        default=False,
+        action='store_true')
     parser.add_argument(
         "--fixed-drift-confidence",
         dest="fixed_drift_confidence",
@@ -122,8 +195,32 @@ def parse_args():
         dest="save_rules",
         default=True,
         action='store_false')
-    args = parser.parse_args()
+    parser.add_argument(
+        "--disable-transaction-cache",
+        dest="transaction_cache",
+        default=True,
+        action='store_false')
+    parser.add_argument(
+        "--log-level",
+        dest="log_level",
+        type=valid_log_level,
+        required=False,
+        default="warning")
+    parser.add_argument(
+        "--rules-format",
+        dest="rules_format",
+        type=valid_rule_format,
+        required=False,
+        default=CsvRuleFormat)
+    parser.add_argument(
+        "--compress-rules",
+        dest="compress_rules",
+        default=False,
+        action='store_true')
+    return parser
 
+
+def check_args(args):
     if args.drift_algorithm == VRChangeDriftAlgorithm:
         if args.fixed_drift_confidence is None:
             print("You must provide a fixed drift confidence in VRChange mode.")
@@ -132,24 +229,50 @@ def parse_args():
         print("Fixed drift confidence is only valid with VRChange mode.")
         sys.exit(-1)
 
+    if args.closed_itemsets and (args.maximal_itemsets or
+                                 args.max_itemset_length is not None or
+                                 (args.workers is not None and
+                                  args.workers > 1)):
+        print("Closed itemsets can't be combined with maximal itemsets, "
+              "--max-itemset-length or --workers.")
+        sys.exit(-1)
+
+    if args.incremental_mining and (args.closed_itemsets or
+                                    args.fp_tree_engine != NodeTreeEngine or
+                                    (args.workers is not None and
+                                     args.workers > 1)):
+        print("Incremental mining can't be combined with closed itemsets, "
+              "--fp-tree-engine or --workers.")
+        sys.exit(-1)
+
+    if args.mining_algorithm != FPGrowthMiningAlgorithm and (
+            args.closed_itemsets or args.incremental_mining or
+            (args.workers is not None and args.workers > 1)):
+        print("Eclat mining can't be combined with closed itemsets, "
+              "incremental mining or --workers.")
+        sys.exit(-1)
+
+
+def parse_args():
+    parser = make_arg_parser(
+        "Association rule data mining in Python - Virtual change detection")
+    args = parser.parse_args()
+    check_args(args)
     return args
 
 
-def write_rules_to_file(rules, output_filename):
-    with open(output_filename, "w") as output_file:
-        output_file.write("Antecedent->Consequent,Confidence,Lift,Support\n")
-        for (antecedent,
-             consequent,
-             confidence,
-             lift,
-             support) in rules:
-            output_file.write(
-                "{} -> {},{:.4f},{:.4f},{:.4f}\n". format(
-                    set_to_string(antecedent),
-                    set_to_string(consequent),
-                    confidence,
-                    lift,
-                    support))
+def write_rules_to_file(
+        rules,
+        output_filename,
+        vocabulary=None,
+        rule_format=CsvRuleFormat,
+        compress=False):
+    with make_rule_writer(output_filename,
+                          rule_format,
+                          vocabulary,
+                          compress) as writer:
+        for rule in rules:
+            writer.write(rule)
 
 
 def make_volatility_detector(args):
@@ -178,123 +301,287 @@ def make_drift_detector(args, volatility_detector):
     return None
 
 
-def main():
-    args = parse_args()
-    program_start = time.time()
-
-    if args.trace_malloc:
-        tracemalloc.start()
-
-    print("Virtual Change/Drift Detection - Association Rule Mining using Python.")
-    print("Drift Algorithm: {}".format(args.drift_algorithm))
-    print("Input file: {}".format(args.input))
-    print("Output file prefix: {}".format(args.output))
-    print("Training window size: {}".format(args.training_window_size))
-    print("Minimum confidence: {}".format(args.min_confidence))
-    print("Minimum support: {}".format(args.min_support))
-    print("Minimum lift: {}".format(args.min_lift))
-    if args.fixed_drift_confidence is not None:
-        print(
-            "Fixed drift confidence of: {}".format(
-                args.fixed_drift_confidence))
-    print("Tracing memory allocations: {}".format(args.trace_malloc))
-    print("Save rules: {}".format(args.save_rules))
-    print("Generating maximal itemsets: {}".format(args.maximal_itemsets))
-
-    reader = iter(DatasetReader(args.input))
-    transaction_num = 0
-    end_of_last_window = 0
-    cohort_num = 1
-    volatility_detector = make_volatility_detector(args)
-    while True:
-        window = take(args.training_window_size, reader)
-        if len(window) == 0:
-            break
-        print("")
-        print(
-            "Mining window [{},{}]".format(
-                transaction_num,
-                transaction_num + len(window)))
-        end_of_last_window = transaction_num + len(window)
-        transaction_num += len(window)
-        print("Running FP-Growth...", flush=True)
-        start = time.time()
-
-        (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
-            window, args.min_support, args.maximal_itemsets)
+def mine_rules(args, window, miner=None, log=print, metrics=None, overlap=0):
+    # Mines the frequent itemsets in window, and returns the list of rules
+    # generated from them. If miner is passed, it's an IncrementalFPGrowth
+    # which holds the previous window, whose last overlap transactions are
+    # the first of this one, and is slid along to this one.
+    if metrics is None:
+        metrics = Counter()
+    if args.mining_algorithm == FPGrowthMiningAlgorithm:
+        log("Running FP-Growth...", flush=True)
+    else:
+        log("Running {}...".format(args.mining_algorithm), flush=True)
+    start = time.time()
+
+    if (args.mining_algorithm == FPGrowthMiningAlgorithm and
+            miner is None and
+            not args.maximal_itemsets and
+            not args.closed_itemsets and
+            (args.workers is None or args.workers < 2)):
+        # Rules are generated from each itemset as it's mined, so the
+        # itemsets aren't collected into a set first. Mining and rule
+        # generation are interleaved, so both count as mining time.
+        (itemsets, num_transactions) = mine_fp_tree_iter(
+            window,
+            args.min_support,
+            False,
+            args.fp_tree_engine,
+            args.max_itemset_length)
         assert(num_transactions == len(window))
+        num_itemsets = Counter()
 
-        duration = time.time() - start
-        print(
-            "FPGrowth mined {} items in {:.2f} seconds".format(
-                len(itemsets),
-                duration))
-
-        print("Generating rules...", flush=True)
-        start = time.time()
+        def counted(itemsets):
+            for itemset in itemsets:
+                num_itemsets["itemsets"] += 1
+                yield itemset
         rules = list(
-            generate_rules(
-                itemsets,
-                itemset_counts,
+            generate_rules_from_stream(
+                counted(itemsets),
                 num_transactions,
                 args.min_confidence,
                 args.min_lift))
         duration = time.time() - start
-        print(
-            "Generated {} rules in {:.2f} seconds".format(
+        metrics["mining_seconds"] += duration
+        metrics["rules"] += len(rules)
+        log(
+            "FPGrowth mined {} items and generated {} rules in {:.2f} "
+            "seconds".format(
+                num_itemsets["itemsets"],
                 len(rules),
                 duration),
             flush=True)
+        return rules
+
+    if args.mining_algorithm != FPGrowthMiningAlgorithm:
+        (itemsets, itemset_counts, num_transactions) = mine_eclat(
+            window,
+            args.min_support,
+            args.maximal_itemsets,
+            args.max_itemset_length,
+            args.mining_algorithm == DEclatMiningAlgorithm)
+    elif miner is not None:
+        miner.expire(len(miner) - overlap)
+        for transaction in islice(window, overlap, None):
+            miner.add(transaction)
+        (itemsets, itemset_counts, num_transactions) = miner.mine(
+            args.maximal_itemsets, args.max_itemset_length)
+    else:
+        (itemsets, itemset_counts, num_transactions) = mine_fp_tree(
+            window,
+            args.min_support,
+            args.maximal_itemsets,
+            args.fp_tree_engine,
+            args.max_itemset_length,
+            args.workers,
+            args.closed_itemsets)
+    assert(num_transactions == len(window))
+
+    duration = time.time() - start
+    metrics["mining_seconds"] += duration
+    log(
+        "FPGrowth mined {} items in {:.2f} seconds".format(
+            len(itemsets),
+            duration))
+
+    log("Generating rules...", flush=True)
+    start = time.time()
+    rules = list(
+        generate_rules(
+            itemsets,
+            itemset_counts,
+            num_transactions,
+            args.min_confidence,
+            args.min_lift))
+    duration = time.time() - start
+    metrics["rules"] += len(rules)
+    log(
+        "Generated {} rules in {:.2f} seconds".format(
+            len(rules),
+            duration),
+        flush=True)
+    return rules
+
+
+def mine_window(args, window, miner=None, overlap=0):
+    # mine_rules() for running in an executor. Metrics are returned rather
+    # than updated in place, so that this can run in another process.
+    metrics = Counter()
+    rules = mine_rules(args, window, miner, quiet, metrics, overlap)
+    return (rules, metrics)
+
+
+def quiet(*args, **kwargs):
+    pass
+
+
+def save_rules(args, rules, cohort_num, vocabulary=None, log=print):
+    start = time.time()
+    output_filename = args.output + "." + str(cohort_num)
+    write_rules_to_file(rules,
+                        output_filename,
+                        vocabulary,
+                        args.rules_format,
+                        args.compress_rules)
+    duration = time.time() - start
+    log(
+        "Wrote rules for cohort {} to file {} in {:.2f} seconds".format(
+            cohort_num, output_filename, duration),
+        flush=True)
+
+
+def log_drift(drift, transaction_num, end_of_last_window, log=print):
+    log(
+        "Detected drift of type {} at transaction {}, {} after end of training window".format(
+            drift.drift_type,
+            transaction_num,
+            transaction_num -
+            end_of_last_window))
+    if drift.hellinger_value is not None:
+        log(
+            "Hellinger value: {}, confidence interval: {} ± {} ([{},{}])".format(
+                drift.hellinger_value,
+                drift.mean,
+                drift.confidence,
+                drift.mean - drift.confidence,
+                drift.mean + drift.confidence))
+
+
+def detect_drifts(args, log=print, metrics=None):
+    # Runs drift detection over the transactions in args.input; repeatedly
+    # mining a training window, generating rules from it, and checking the
+    # transactions which follow against the rules until a drift is detected.
+    # Yields (transaction_num, drift) for each drift detected, and writes
+    # progress through log. If metrics is passed, it's a Counter which is
+    # updated with the number of windows mined, time spent mining, and the
+    # number of rules, drifts and transactions.
+    #
+    # Transactions are read into a TransactionStore, memory mapped from
+    # the input's cache, or from a temporary file parsed the same way if
+    # args.transaction_cache is False, and each training window and block
+    # of test transactions is a view of it, so memory use doesn't grow with
+    # the length of the stream.
+    if metrics is None:
+        metrics = Counter()
+
+    # Transactions are item ids interned in the vocabulary; we only map them
+    # back to item names when writing out rules.
+    vocabulary = Vocabulary()
+    store = load_transactions(args.input, vocabulary, args.transaction_cache)
+    transaction_num = 0
+    end_of_last_window = 0
+    cohort_num = 1
+    volatility_detector = make_volatility_detector(args)
+    # In incremental mining mode, one FP-tree is kept for the whole run, and
+    # slid along from each training window to the next. The window mined
+    # after a drift is then the one ending at the drift, rather than the one
+    # starting there, so that it overlaps the last window when the drift is
+    # detected within a window's length of it, and only the transactions in
+    # between are added to the tree.
+    miner = None
+    if args.incremental_mining:
+        miner = IncrementalFPGrowth(
+            args.training_window_size, args.min_support)
+    window_start = 0
+    while True:
+        window = store.window(
+            window_start, window_start + args.training_window_size)
+        if len(window) == 0:
+            break
+        metrics["windows"] += 1
+        log("")
+        log(
+            "Mining window [{},{}]".format(
+                window_start,
+                window_start + len(window)))
+        overlap = max(0, end_of_last_window - window_start)
+        end_of_last_window = window_start + len(window)
+        transaction_num = end_of_last_window
+        window_start = transaction_num
+        rules = mine_rules(args, window, miner, log, metrics, overlap)
 
         if len(rules) == 0:
-            print("No rules; just noise. Skipping change detection.")
-            print("Consider increasing training window size or lowering minsup/conf.")
+            log("No rules; just noise. Skipping change detection.")
+            log("Consider increasing training window size or lowering minsup/conf.")
             continue
 
         if args.save_rules:
-            start = time.time()
-            output_filename = args.output + "." + str(cohort_num)
+            save_rules(args, rules, cohort_num, vocabulary, log)
             cohort_num += 1
-            write_rules_to_file(rules, output_filename)
-            print(
-                "Wrote rules for cohort {} to file {} in {:.2f} seconds".format(
-                    cohort_num, output_filename, duration),
-                flush=True)
 
         drift_detector = make_drift_detector(args, volatility_detector)
         drift_detector.train(window, rules)
 
-        # Read transactions until a drift is detected.
-        for transaction in reader:
-            transaction_num += 1
-            drift = drift_detector.check_for_drift(
-                transaction, transaction_num)
+        # Check blocks of transactions until a drift is detected. Drifts are
+        # only tested for every SAMPLE_INTERVAL transactions, so the
+        # detector is handed a whole block at a time; the final partial
+        # block can't be sampled.
+        drift = None
+        while transaction_num < len(store):
+            block = store.window(
+                transaction_num, transaction_num + SAMPLE_INTERVAL)
+            transaction_num += len(block)
+            if len(block) < SAMPLE_INTERVAL:
+                break
+            drift = drift_detector.check_block(block, transaction_num)
             if drift is not None:
-                print(
-                    "Detected drift of type {} at transaction {}, {} after end of training window".format(
-                        drift.drift_type,
-                        transaction_num,
-                        transaction_num -
-                        end_of_last_window))
-                if drift.hellinger_value is not None:
-                    print(
-                        "Hellinger value: {}, confidence interval: {} ± {} ([{},{}])".format(
-                            drift.hellinger_value,
-                            drift.mean,
-                            drift.confidence,
-                            drift.mean - drift.confidence,
-                            drift.mean + drift.confidence))
+                metrics["drifts"] += 1
+                log_drift(drift, transaction_num, end_of_last_window, log)
                 # Record the drift in the volatility detector. This is used inside
                 # the drift detector to help determine how large a confidence interval
                 # is required when detecting drifts.
                 if volatility_detector is not None:
                     volatility_detector.add(transaction_num)
+                yield (transaction_num, drift)
                 # Break out of the inner loop, we'll jump back up to the top and mine
                 # a new training window.
                 break
 
         if len(window) < args.training_window_size:
             break
+        window_start = transaction_num
+        if drift is not None and miner is not None:
+            window_start -= args.training_window_size
+
+    metrics["transactions"] = transaction_num
+
+
+def main():
+    args = parse_args()
+    program_start = time.time()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+
+    if args.trace_malloc:
+        tracemalloc.start()
+
+    print("Virtual Change/Drift Detection - Association Rule Mining using Python.")
+    print("Drift Algorithm: {}".format(args.drift_algorithm))
+    print("Input file: {}".format(args.input))
+    print("Output file prefix: {}".format(args.output))
+    print("Training window size: {}".format(args.training_window_size))
+    print("Minimum confidence: {}".format(args.min_confidence))
+    print("Minimum support: {}".format(args.min_support))
+    print("Minimum lift: {}".format(args.min_lift))
+    if args.fixed_drift_confidence is not None:
+        print(
+            "Fixed drift confidence of: {}".format(
+                args.fixed_drift_confidence))
+    print("Tracing memory allocations: {}".format(args.trace_malloc))
+    print("Save rules: {}".format(args.save_rules))
+    print("Transaction cache: {}".format(args.transaction_cache))
+    print("Rules format: {}".format(args.rules_format))
+    print("Compress rules: {}".format(args.compress_rules))
+    print("Generating maximal itemsets: {}".format(args.maximal_itemsets))
+    print("Generating closed itemsets: {}".format(args.closed_itemsets))
+    print("Mining algorithm: {}".format(args.mining_algorithm))
+    print("FP-tree engine: {}".format(args.fp_tree_engine))
+    print("Maximum itemset length: {}".format(args.max_itemset_length))
+    print("FP-Growth worker processes: {}".format(args.workers))
+    print("Incremental mining: {}".format(args.incremental_mining))
+    print("Log level: {}".format(args.log_level))
+
+    for _ in detect_drifts(args):
+        pass
 
     print("\nEnd of stream\n")
 
@@ -1,6 +1,5 @@
 import numpy
 from collections import Counter
-from rollingmean import RollingMean
 from scipy import stats
 
 SIMILARITY_TEST_CONFIDENCE = 0.95
@@ -12,44 +11,122 @@ MAX_NUM_PATTERN_SAMPLES = 100
 USE_CHI_SQUARED_SIMILARITY = False
 
 
-def outliers_iqr(ys):
-    quartile_1, quartile_3 = numpy.percentile(ys, [25, 75])
-    iqr = quartile_3 - quartile_1
-    lower_bound = quartile_1 - (iqr * 1.5)
-    upper_bound = quartile_3 + (iqr * 1.5)
-    return [x for x in ys if x <= upper_bound and x >= lower_bound]
+SQRT_2PI = numpy.sqrt(2 * numpy.pi)
+
+
+def normal_pdf(x, means, scales):
+    # scipy.stats.norm.pdf(x, means, scales) for arrays of means and
+    # scales, computed on arrays as it does, so giving the same results,
+    # without its overhead for each call.
+    z = (x - means) / scales
+    return numpy.exp(-z**2 / 2.0) / SQRT_2PI / scales
+
+
+def quartiles(sorted_samples):
+    # The first and third quartiles of sorted_samples, interpolated as
+    # numpy.percentile() does.
+    result = []
+    for q in [0.25, 0.75]:
+        position = (len(sorted_samples) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(sorted_samples) - 1)
+        result.append(sorted_samples[lower] + (
+            sorted_samples[upper] - sorted_samples[lower]) * (position - lower))
+    return result
 
 
 class Pattern:
-    def __init__(self, id):
+    # A pattern's samples are kept in the order they were added, in a ring
+    # buffer with room for MAX_NUM_PATTERN_SAMPLES and the sample being
+    # added, and sorted, in sorted_samples, padded with infinity. The sorted
+    # samples may be a row of the PatternNetwork's table of all its
+    # patterns' samples. Their total is kept up to date for the mean, and
+    # the quartiles for removing outliers are read off the sorted samples.
+    def __init__(self, id, row=None, sorted_samples=None):
         self.id = id
-        self.samples = []  # "Volatility Window"
+        # The row of the PatternNetwork's table which sorted_samples is.
+        self.row = row
+        self.ring = numpy.zeros(MAX_NUM_PATTERN_SAMPLES + 1, dtype=numpy.int64)
+        self.start = 0
+        self.size = 0  # "Volatility Window"
+        if sorted_samples is None:
+            sorted_samples = numpy.full(MAX_NUM_PATTERN_SAMPLES + 1,
+                                        numpy.inf)
+        self.sorted_samples = sorted_samples
+        self.total = 0
         self.connections = Counter()  # Transition network.
 
+    def samples(self):
+        # The samples, oldest first.
+        return numpy.roll(self.ring, -self.start)[:self.size]
+
     def ks_test(self, drift_interval):
-        assert(len(self.samples) > 0)
-        (_, p_value) = stats.ks_2samp(numpy.array(
-            [drift_interval]), numpy.array(self.samples))
+        assert(self.size > 0)
+        (_, p_value) = stats.ks_2samp(numpy.array([drift_interval]),
+                                      self.samples())
         return p_value
 
     def mean(self):
-        rolling_mean = RollingMean()
-        for sample in self.samples:
-            rolling_mean.add_sample(sample)
-        return rolling_mean.mean()
+        return self.total / self.size
 
     def add_sample(self, drift_interval):
-        self.samples.append(drift_interval)
+        self.ring[(self.start + self.size) % len(self.ring)] = drift_interval
+        self.size += 1
+        self.insert_sorted(drift_interval)
+        self.total += drift_interval
         # Remove outliers.
-        if len(self.samples) > 5:
-            self.samples = outliers_iqr(self.samples)
-            assert(len(self.samples) > 0)
+        if self.size > 5:
+            (quartile_1, quartile_3) = quartiles(
+                self.sorted_samples[:self.size])
+            iqr = quartile_3 - quartile_1
+            self.remove_outside(quartile_1 - (iqr * 1.5),
+                                quartile_3 + (iqr * 1.5))
+            assert(self.size > 0)
         # Ensure patterns don't grow unbounded.
-        if len(self.samples) > MAX_NUM_PATTERN_SAMPLES:
-            self.samples.pop(0)
+        if self.size > MAX_NUM_PATTERN_SAMPLES:
+            oldest = int(self.ring[self.start])
+            self.start = (self.start + 1) % len(self.ring)
+            self.size -= 1
+            self.remove_sorted(oldest)
+            self.total -= oldest
+
+    def insert_sorted(self, sample):
+        # The new sample's slot in sorted_samples is past the end, so is
+        # padding, until it's shifted into place.
+        n = self.size - 1
+        position = numpy.searchsorted(
+            self.sorted_samples[:n], sample, side="right")
+        self.sorted_samples[position + 1:n + 1] = \
+            self.sorted_samples[position:n]
+        self.sorted_samples[position] = sample
+
+    def remove_sorted(self, sample):
+        n = self.size + 1
+        position = numpy.searchsorted(self.sorted_samples[:n], sample)
+        self.sorted_samples[position:n - 1] = \
+            self.sorted_samples[position + 1:n]
+        self.sorted_samples[n - 1] = numpy.inf
+
+    def remove_outside(self, lower_bound, upper_bound):
+        # Removes the samples below lower_bound or above upper_bound, which
+        # are at the ends of the sorted samples.
+        sorted_samples = self.sorted_samples[:self.size]
+        first = numpy.searchsorted(sorted_samples, lower_bound, side="left")
+        last = numpy.searchsorted(sorted_samples, upper_bound, side="right")
+        if first == 0 and last == self.size:
+            return
+        samples = self.samples()
+        keep = (samples >= lower_bound) & (samples <= upper_bound)
+        self.total -= int(samples[~keep].sum())
+        samples = samples[keep]
+        self.ring[:len(samples)] = samples
+        self.start = 0
+        self.size = len(samples)
+        self.sorted_samples[:last - first] = self.sorted_samples[first:last]
+        self.sorted_samples[last - first:] = numpy.inf
 
     def chisquare(self, drift_interval):
-        samples = self.samples
+        samples = list(self.samples())
         if len(samples) == 1:
             samples += [samples[0]]
         (_, p_val) = stats.chisquare([drift_interval], samples)
@@ -68,21 +145,66 @@ class PatternNetwork:
         self.patterns = dict()
         self.next_pattern_id = 1
         self.last_drift_pattern_id = None
+        # The patterns' sorted samples, one row per pattern, so that a drift
+        # interval is compared against every pattern at once. There's a row
+        # for the pattern which may be added before the least recently hit
+        # one is removed.
+        self.sorted_samples = numpy.full(
+            (MAX_PATTERN_SET_SIZE + 1, MAX_NUM_PATTERN_SAMPLES + 1),
+            numpy.inf)
+        self.free_rows = list(range(MAX_PATTERN_SET_SIZE, -1, -1))
+        # p-values of the two sample Kolmogorov-Smirnov test of a single
+        # drift interval against a pattern's samples, indexed by the number
+        # of samples, n, and the larger of the numbers of samples below and
+        # above the interval, k; the test statistic is k / n. Filled in as
+        # they're needed, by ks_p_values().
+        self.ks_p_value_table = numpy.full(
+            (MAX_NUM_PATTERN_SAMPLES + 1, MAX_NUM_PATTERN_SAMPLES + 1),
+            numpy.nan)
+        # Maps a number of patterns to expected_drifts() for it.
+        self.expected_drift_cache = dict()
+
+    def similarities(self, drift_interval):
+        # Returns the similarity of each pattern to drift_interval, in the
+        # order of self.patterns.
+        if USE_CHI_SQUARED_SIMILARITY:
+            return [pattern.chisquare(drift_interval)
+                    for pattern in self.patterns.values()]
+        rows = [pattern.row for pattern in self.patterns.values()]
+        samples = self.sorted_samples[rows]
+        sizes = numpy.count_nonzero(samples < numpy.inf, axis=1)
+        below = numpy.count_nonzero(samples < drift_interval, axis=1)
+        above = sizes - numpy.count_nonzero(samples <= drift_interval, axis=1)
+        return self.ks_p_values(sizes, numpy.maximum(below, above))
+
+    def ks_p_values(self, sizes, statistics):
+        p_values = self.ks_p_value_table[sizes, statistics]
+        for i in numpy.flatnonzero(numpy.isnan(p_values)):
+            (n, k) = (int(sizes[i]), int(statistics[i]))
+            # Any n samples with k below the interval and none above it give
+            # the same statistic, and so the same p-value.
+            (_, p_value) = stats.ks_2samp(
+                numpy.array([0]), numpy.array([-1] * k + [0] * (n - k)))
+            self.ks_p_value_table[n, k] = p_value
+            p_values[i] = p_value
+        return p_values
 
     def add(self, transaction_num):
         drift_interval = transaction_num - self.last_drift_transaction_num
         self.last_drift_transaction_num = transaction_num
+        self.expected_drift_cache.clear()
 
         # Find the pattern which has the highest Kolmogorov-Smirnov test
         # statistic value, i.e. the most likely to be from the same
         # distribution.
         max_p_val = 0
         max_p_val_id = 0
-        for id, pattern in self.patterns.items():
-            p_val = pattern.similarity(drift_interval)
-            if p_val > max_p_val:
-                max_p_val = p_val
-                max_p_val_id = id
+        if len(self.patterns) > 0:
+            p_vals = self.similarities(drift_interval)
+            best = int(numpy.argmax(p_vals))
+            if p_vals[best] > max_p_val:
+                max_p_val = p_vals[best]
+                max_p_val_id = list(self.patterns)[best]
 
         if max_p_val > SIMILARITY_TEST_CONFIDENCE:
             # Found at least one pattern.
@@ -93,7 +215,8 @@ class PatternNetwork:
             # new pattern.
             id = self.next_pattern_id
             self.next_pattern_id += 1
-            self.patterns[id] = Pattern(id)
+            row = self.free_rows.pop()
+            self.patterns[id] = Pattern(id, row, self.sorted_samples[row])
         self.patterns[id].add_sample(drift_interval)
 
         # Update transition matrix.
@@ -113,55 +236,70 @@ class PatternNetwork:
                     lru_transaction_num = pattern.last_hit_transaction_num
                     lru_pattern_id = pattern_id
             # Remove the pattern.
-            self.patterns.pop(lru_pattern_id)
+            row = self.patterns.pop(lru_pattern_id).row
+            self.sorted_samples[row] = numpy.inf
+            self.free_rows.append(row)
             # Remove connections in the network to the pattern being removed.
             for pattern_id, pattern in self.patterns.items():
                 pattern.connections.pop(lru_pattern_id, None)
 
+    def expected_drifts(self, sample_size):
+        # Returns the list of next expected (drift_position, drift_interval)
+        # for the sample_size patterns which most commonly follow the last
+        # drift's pattern, most common first. These only change when a drift
+        # is added, so are cached until then.
+        drifts = self.expected_drift_cache.get(sample_size)
+        if drifts is not None:
+            return drifts
+        drifts = []
+        if self.last_drift_pattern_id is not None:
+            most_common = self.patterns[
+                self.last_drift_pattern_id].connections.most_common(
+                sample_size)
+            for id, _ in most_common:
+                drift_interval = self.patterns[id].mean()
+                drift_position = (self.last_drift_transaction_num +
+                                  drift_interval)
+                drifts.append((drift_position, drift_interval))
+        self.expected_drift_cache[sample_size] = drifts
+        return drifts
+
     def likely_connections_at(
             self,
             sample_size,
             num_connections,
             transaction_num):
         # Returns list of next expected (drift_position, drift_interval)
-        if self.last_drift_pattern_id is None or len(
-                self.patterns[self.last_drift_pattern_id].connections) == 0:
-            return []
-        drifts = []
-        most_common = list(
-            self.patterns[self.last_drift_pattern_id].connections.most_common(sample_size))
-        assert(len(most_common) > 0)
-        for id, _ in most_common:
-            drift_interval = self.patterns[id].mean()
-            drift_position = self.last_drift_transaction_num + drift_interval
-            distance = abs(transaction_num - drift_position)
-            drifts += [(distance, drift_position, drift_interval)]
+        drifts = self.expected_drifts(sample_size)
         # Sort by distance.
-        drifts.sort(key=lambda x: x[0])
-        assert(len(drifts) > 0)
-        return list(map(lambda x: (x[1], x[2]), drifts[:num_connections]))
+        drifts = sorted(
+            drifts, key=lambda x: abs(transaction_num - x[0]))
+        return drifts[:num_connections]
 
 
 class VolatilityDetector:
     def __init__(self):
         self.pattern_network = PatternNetwork()
+        # The normal distributions the drift confidence is drawn from, one
+        # for each of the next expected drifts; arrays of their positions,
+        # scales and peaks, the PDF at the position. Recomputed after each
+        # drift.
+        self.positions = numpy.zeros(0)
+        self.scales = numpy.zeros(0)
+        self.peaks = numpy.zeros(0)
 
     def drift_confidence(self, transaction_num):
         # Find the maximum of the two closest expected drift points' probability
         # distribution function, and the maximum value of the two closest expected
         # drift points' PDF at the current transaction number.
-        connections = self.pattern_network.likely_connections_at(
-            10, 2, transaction_num)
-        if len(connections) == 0:
+        if len(self.positions) == 0:
             return 1.0
-        max_pdf = 0
-        position_max_pdf = 0
-        assert(len(connections) > 0)
-        for position, interval in connections:
-            scale = interval / 2
-            max_pdf = max(max_pdf, stats.norm.pdf(position, position, scale))
-            pdf = stats.norm.pdf(transaction_num, position, scale)
-            position_max_pdf = max(position_max_pdf, pdf)
+        nearest = numpy.argsort(
+            numpy.abs(transaction_num - self.positions), kind="stable")[:2]
+        max_pdf = self.peaks[nearest].max()
+        position_max_pdf = normal_pdf(transaction_num,
+                                      self.positions[nearest],
+                                      self.scales[nearest]).max()
 
         position_max_pdf /= max_pdf
         assert(position_max_pdf >= 0 and position_max_pdf <= 1)
@@ -169,6 +307,10 @@ class VolatilityDetector:
 
     def add(self, transaction_num):
         self.pattern_network.add(transaction_num)
+        drifts = self.pattern_network.expected_drifts(10)
+        self.positions = numpy.array([position for (position, _) in drifts])
+        self.scales = numpy.array([interval / 2 for (_, interval) in drifts])
+        self.peaks = normal_pdf(self.positions, self.positions, self.scales)
 
 
 class ProSeedVolatilityDetector: